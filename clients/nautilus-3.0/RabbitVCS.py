@@ -115,13 +115,14 @@ class RabbitVCS(Nautilus.InfoProvider, Nautilus.MenuProvider,
     # script itself.
     nautilusVFSFile_table = {}
 
-    #: This is in case we want to permanently enable invalidation of the status
-    #: checker info.
+    #: Whether to have the status checker check items again when we see them
+    #: again. This is not needed if the checker watches the filesystem and
+    #: tells us when statuses change (see __init__).
     always_invalidate = True
 
     #: When we get the statuses from the callback, put them here for further
-    #: use. This is of the form: [("path/to", {...status dict...}), ...]
-    statuses_from_callback = []
+    #: use. This is of the form: {"path/to": status object, ...}
+    statuses_from_callback = {}
 
     def get_local_path(self, path):
         return path.replace("file://", "")
@@ -195,6 +196,17 @@ class RabbitVCS(Nautilus.InfoProvider, Nautilus.MenuProvider,
         self.status_checker = StatusChecker()
         
         self.status_checker.assert_version(EXT_VERSION)
+
+        self.always_invalidate = not self.status_checker.is_watching()
+
+        # Newer checkers push new statuses to us when paths change, older
+        # ones just tell us which paths have gone stale
+        if self.status_checker.use_packed:
+            self.status_checker.connect_statuses_changed(
+                self.cb_statuses_changed)
+        else:
+            self.status_checker.connect_statuses_invalidated(
+                self.cb_statuses_invalidated)
         
         self.items_cache = {}
         
@@ -262,7 +274,7 @@ class RabbitVCS(Nautilus.InfoProvider, Nautilus.MenuProvider,
         # log.debug("update_file_info() called for %s" % path)
 
         invalidate = False
-        if path in self.nautilusVFSFile_table:
+        if self.always_invalidate and path in self.nautilusVFSFile_table:
             invalidate = True
 
         # Always replace the item in the table with the one we receive, because
@@ -279,24 +291,16 @@ class RabbitVCS(Nautilus.InfoProvider, Nautilus.MenuProvider,
 
         # Do our magic...
 
-        # I have added extra logic in cb_status, using a list
-        # (paths_from_callback) that should allow us to work around this for
-        # now. But it'd be good to have an actual status monitor.
-
-        found = False
-        status = None
-        # Could replace with (st for st in self.... if st.path ...).next()
-        # Need to catch exception
-        for idx in xrange(len(self.statuses_from_callback)):
-            found = (self.statuses_from_callback[idx].path) == path
-            if found: break
+        # I have added extra logic in cb_status, using a dict
+        # (statuses_from_callback) that should allow us to work around this
+        # for now. But it'd be good to have an actual status monitor.
 
-        if found: # We're here because we were triggered by a callback
-            status = self.statuses_from_callback[idx]
-            del self.statuses_from_callback[idx]
+        # If we're here because we were triggered by a callback, the status
+        # is waiting for us
+        status = self.statuses_from_callback.pop(path, None)
 
         # Don't bother the checker if we already have the info from a callback
-        if not found:
+        if status is None:
             status = \
                 self.status_checker.check_status(path,
                                                  recurse=True,
@@ -527,7 +531,7 @@ class RabbitVCS(Nautilus.InfoProvider, Nautilus.MenuProvider,
                 # We're not interested in the result now, just the callback
                 self.status_checker.check_status(path,
                                                  recurse=True,
-                                                 invalidate=True,
+                                                 invalidate=self.always_invalidate,
                                                  callback=self.cb_status,
                                                  summary=True)
 
@@ -599,7 +603,7 @@ class RabbitVCS(Nautilus.InfoProvider, Nautilus.MenuProvider,
             # After invalidating C{update_file_info} applies the correct emblem.
             # Since invalidation triggers an "update_file_info" call, we can
             # tell it NOT to invalidate the status checker path.
-            self.statuses_from_callback.append(status)
+            self.statuses_from_callback[status.path] = status
             # NOTE! There is a call to "update_file_info" WITHIN the call to
             # invalidate_extension_info() - beware recursion!
             item.invalidate_extension_info()
@@ -608,6 +612,37 @@ class RabbitVCS(Nautilus.InfoProvider, Nautilus.MenuProvider,
         else:
             log.debug("Path [%s] not found in file table" % status.path)
 
+    def cb_statuses_changed(self, statuses):
+        """
+        This is called when the status checker sends out new statuses that we
+        did not ask for, because the paths changed on disk. A whole working
+        copy's worth of statuses can arrive in one go.
+
+        @type   statuses: list of status objects
+        @param  statuses: The new statuses
+        """
+        for status in statuses:
+            self.cb_status(status)
+
+    def cb_statuses_invalidated(self, paths):
+        """
+        This is called when the status checker notices that the statuses of
+        some paths (and of everything below them) may have changed.
+
+        Invalidating the extension info of the affected items (and of the
+        directories above them, since their summaries may have changed) makes
+        Nautilus call C{update_file_info} for them again.
+
+        @type   paths: list of strings
+        @param  paths: The paths whose statuses are stale
+        """
+        for path in paths:
+            for item_path, item in self.nautilusVFSFile_table.items():
+                if (item_path == path
+                        or item_path.startswith(path + os.sep)
+                        or path.startswith(item_path + os.sep)):
+                    item.invalidate_extension_info()
+
     def get_property_pages(self, items):
         paths = []
 
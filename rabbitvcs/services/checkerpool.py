@@ -0,0 +1,469 @@
+#
+# This is an extension to the Nautilus file manager to allow better
+# integration with the Subversion source control system.
+#
+# Copyright (C) 2006-2008 by Jason Field <jason@jasonfield.com>
+# Copyright (C) 2007-2008 by Bruce van der Kooij <brucevdkooij@gmail.com>
+# Copyright (C) 2008-2010 by Adam Plumb <adamplumb@gmail.com>
+#
+# RabbitVCS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# RabbitVCS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RabbitVCS;  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" A pool of status checking threads for the checker service.
+
+A single slow status check (eg. "svn status" on a working copy mounted over
+NFS) should not hold up the status checks for every other working copy. The
+StatusCheckerPool runs a number of worker threads, each with its own VCS
+instance (and so its own clients and status caches), and:
+
+    - pins every working copy to one worker, so that its statuses are only
+      ever cached in one place and independent working copies are checked in
+      parallel
+    - folds identical requests that are waiting to be run into one
+    - runs requests for visible items before background rechecks
+
+Results are handed back to the main loop with gobject.idle_add, so callbacks
+never run in a worker thread.
+
+The workers are threads rather than processes. A check spends most of its
+time outside the interpreter, where other threads can run: git checks wait on
+"git" subprocesses, pysvn releases the GIL while Subversion does its work, and
+Mercurial checks are mostly stat() calls and file reads. Worker processes
+would also mean sending every status back over a pipe, and would put the
+caches out of reach of the service's statistics and of the StatusStore.
+
+If the pool is given a StatusStore, the statuses of each working copy are
+loaded from it the first time the working copy is seen (and then refreshed in
+the background), and saved back to it periodically and when quitting.
+"""
+
+import heapq
+import threading
+
+try:
+    from gi.repository import GObject as gobject
+except ImportError:
+    import gobject
+
+import rabbitvcs.vcs
+import rabbitvcs.vcs.status
+from rabbitvcs.services.statuschecker import StatusChecker
+
+from rabbitvcs import gettext
+_ = gettext.gettext
+
+from rabbitvcs.util.log import Log
+log = Log("rabbitvcs.services.checkerpool")
+
+# Job priorities, lower numbers are run first
+PRIORITY_INVALIDATE = 0
+PRIORITY_VISIBLE = 1
+PRIORITY_BACKGROUND = 2
+
+MAX_WORKERS = 4
+
+# How often to save cached statuses to the store (in milliseconds)
+SAVE_INTERVAL = 5 * 60 * 1000
+
+# How long to wait for a busy worker when quitting (in seconds)
+QUIT_TIMEOUT = 5
+
+def get_worker_count():
+    """
+    Returns the number of worker threads to use, which is the number of
+    processors (up to MAX_WORKERS).
+    """
+    try:
+        import multiprocessing
+        count = multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        count = 1
+
+    return max(1, min(count, MAX_WORKERS))
+
+class StatusJob:
+    """ A task waiting to be run, and the callbacks waiting for its result.
+    """
+
+    def __init__(self, key, function, priority):
+        self.key = key
+        self.function = function
+        self.priority = priority
+        self.callbacks = []
+
+class StatusWorker(threading.Thread):
+    """ A thread that runs status checks (and other tasks that touch its
+    status caches) for the working copies assigned to it, in priority order.
+    """
+
+    def __init__(self, name):
+        threading.Thread.__init__(self, name=name)
+        self.setDaemon(True)
+
+        # A private VCS instance, so that clients (which are not thread safe)
+        # and their caches are not shared with other workers
+        self.vcs_client = rabbitvcs.vcs.VCS(clients={})
+
+        self.condition = threading.Condition()
+        self.heap = []
+        self.counter = 0
+        self.jobs = {}
+        self.running = True
+
+        # The working copy roots pinned to this worker, mapped to their VCS
+        self.roots = {}
+
+    def submit_task(self, key, function, priority, callback=None):
+        """ Queues a task. If a task with the same key is already waiting to
+        be run, the callback is added to it (and its priority raised if need
+        be). Tasks with the same priority are run in the order they were
+        queued.
+
+        @param function: called in the worker thread with no arguments
+        @param callback: called in the main loop with the result of the
+                         function, or with the exception if it failed
+        """
+        self.condition.acquire()
+        try:
+            job = self.jobs.get(key)
+            if job is None:
+                job = StatusJob(key, function, priority)
+                self.jobs[key] = job
+                self._push(job)
+            elif priority < job.priority:
+                # The old heap entry is skipped when it comes up
+                job.priority = priority
+                self._push(job)
+
+            if callback:
+                job.callbacks.append(callback)
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def _push(self, job):
+        self.counter += 1
+        heapq.heappush(self.heap, (job.priority, self.counter, job))
+
+    def submit(self, path, recurse, invalidate, summary, priority, callback):
+        """ Queues a status check, see submit_task. """
+        def check_status():
+            if recurse:
+                # Scan everything below the path in one go, so that the
+                # checks for its children that follow (see
+                # StatusCheckerStub.queue_status_check) come from the cache
+                self.vcs_client.statuses(path, recurse=True,
+                                         invalidate=invalidate)
+                return self.vcs_client.status(path, summary, False)
+            return self.vcs_client.status(path, summary, invalidate)
+
+        self.submit_task(("status", path, recurse, invalidate, summary),
+                         check_status, priority, callback)
+
+    def invalidate(self, path):
+        """ Queues the invalidation of any cached statuses for the given path,
+        to be done before any waiting status checks.
+        """
+        def invalidate():
+            self.vcs_client.invalidate(path)
+
+        self.submit_task(("invalidate", path), invalidate,
+                         PRIORITY_INVALIDATE)
+
+    def pending(self):
+        return len(self.jobs)
+
+    def _next(self):
+        """ Blocks until there is something to do, and returns the job to run.
+        Returns None when the worker should stop.
+        """
+        self.condition.acquire()
+        try:
+            while self.running:
+                while self.heap:
+                    (priority, count, job) = heapq.heappop(self.heap)
+                    if (priority == job.priority
+                            and self.jobs.get(job.key) is job):
+                        del self.jobs[job.key]
+                        return job
+
+                self.condition.wait()
+        finally:
+            self.condition.release()
+
+        return None
+
+    def run(self):
+        while True:
+            job = self._next()
+            if job is None:
+                break
+
+            try:
+                result = job.function()
+            except Exception, ex:
+                log.exception(ex)
+                result = ex
+
+            for callback in job.callbacks:
+                gobject.idle_add(callback, result)
+
+    def load_statuses(self, root, vcs, store):
+        """ Fills the status cache for the given working copy from the store.
+        Must be called from this worker's thread.
+        """
+        statuses = store.load(root, vcs)
+        if not statuses:
+            return
+
+        cache = self.vcs_client.client(root).cache
+        if root in cache:
+            return
+
+        cache.mark_subtree(root)
+        for status in statuses:
+            cache[status.path] = status
+
+        # The store holds everything that was cached below the root, so the
+        # clients can answer from it until it is refreshed
+        cache.mark_scanned(root, True)
+        cache.summarize(root, statuses)
+
+        log.debug("Loaded %i statuses for %s" % (len(statuses), root))
+
+    def refresh_statuses(self, root):
+        """ Replaces the cached statuses for the given working copy with fresh
+        ones from a recursive scan of it. The loaded statuses are replaced in
+        place: they are still given out while the scan runs, and afterwards
+        only those the scan did not report again are dropped. Must be called
+        from this worker's thread.
+        """
+        client = self.vcs_client.client(root)
+        cache = client.cache
+
+        cache.forget_scans(root)
+        statuses = client.statuses(root, recurse=True)
+        if (len(statuses) == 1 and statuses[0].content in
+                (rabbitvcs.vcs.status.status_unknown,
+                 rabbitvcs.vcs.status.status_error)):
+            # Leave the loaded statuses be, the next check will scan again
+            return statuses
+
+        fresh = set([status.path for status in statuses])
+        stale = [path for path in cache.index.iter_subtree(root)
+                    if path not in fresh]
+        for path in stale:
+            if path in cache.cache:
+                cache.invalidate_path(path, keep_ancestor_scans=True)
+
+        cache.mark_scanned(root, True)
+        cache.summarize(root, statuses)
+        return statuses
+
+    def save_statuses(self, store):
+        """ Saves the cached statuses of this worker's working copies to the
+        store. Must be called from this worker's thread (or once it has
+        stopped).
+        """
+        for root, vcs in self.roots.items():
+            cache = self.vcs_client.client(root).cache
+            statuses = [status for status in cache.find_path_statuses(root)
+                            if status is not None]
+            if statuses:
+                store.save(root, vcs, statuses)
+
+    def stop(self):
+        self.condition.acquire()
+        try:
+            self.running = False
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+class StatusCheckerPool(StatusChecker):
+    """ A status checker that spreads its work over a pool of threads. Status
+    checks are asynchronous: see check_status_many.
+    """
+
+    CHECKER_NAME = _("Threaded status checker")
+
+    def __init__(self, workers=None, store=None, refreshed=None):
+        """
+        @param workers: the number of worker threads (by default, see
+                        get_worker_count)
+        @type workers: int
+
+        @param store: where to keep statuses between runs
+        @type store: a StatusStore, or None
+
+        @param refreshed: called (in the main loop) with a list containing
+                          a working copy root, once the statuses loaded
+                          from the store have been replaced by fresh ones
+        @type refreshed: a callable taking a single list argument
+        """
+        StatusChecker.__init__(self)
+
+        if workers is None:
+            workers = get_worker_count()
+
+        self.workers = []
+        for i in range(workers):
+            worker = StatusWorker("StatusWorker-%i" % i)
+            worker.start()
+            self.workers.append(worker)
+
+        # Working copy roots, mapped to the worker they are pinned to
+        self.assignments = {}
+
+        self.store = store
+        self.refreshed = refreshed
+        if self.store:
+            gobject.timeout_add(SAVE_INTERVAL, self.save_statuses)
+
+    def worker_for(self, path):
+        """ Returns the worker that owns the working copy of the given path.
+        New working copies go to the worker with the fewest of them.
+        """
+        guess = rabbitvcs.vcs.guess(path)
+        if guess["vcs"] == rabbitvcs.vcs.VCS_DUMMY:
+            return self.workers[0]
+
+        root = guess["repo_path"]
+        worker = self.assignments.get(root)
+        if worker is None:
+            worker = min(self.workers, key=lambda w: len(w.roots))
+            worker.roots[root] = guess["vcs"]
+            self.assignments[root] = worker
+
+            if self.store:
+                self._load_statuses(worker, root, guess["vcs"])
+
+        return worker
+
+    def _load_statuses(self, worker, root, vcs):
+        """ Has the worker fill its cache from the store before running any
+        checks for the working copy, then refresh it in the background.
+        """
+        def load():
+            worker.load_statuses(root, vcs, self.store)
+
+        def refresh():
+            return worker.refresh_statuses(root)
+
+        def refreshed(result):
+            if self.refreshed and not isinstance(result, Exception):
+                self.refreshed([root])
+            return False
+
+        worker.submit_task(("load", root), load, PRIORITY_INVALIDATE)
+        worker.submit_task(("refresh", root), refresh, PRIORITY_BACKGROUND,
+                           refreshed)
+
+    def save_statuses(self):
+        """ Has every worker save its cached statuses to the store, once it
+        has nothing more urgent to do.
+        """
+        for worker in self.workers:
+            worker.submit_task(("save",), lambda w=worker:
+                                    w.save_statuses(self.store),
+                               PRIORITY_BACKGROUND)
+
+        # Keep saving periodically
+        return True
+
+    def check_status_many(self, paths, recurse, summary, invalidate, callback,
+                          background=False):
+        """ Queues status checks for several paths. Once they are all done,
+        the callback is called (in the main loop) with the list of statuses,
+        in the same order as the paths. A path whose check fails gets an
+        error status, without affecting the others.
+
+        @param background: whether these checks can wait for the checks of
+                           visible items
+        @type background: boolean
+        """
+        if background:
+            priority = PRIORITY_BACKGROUND
+        else:
+            priority = PRIORITY_VISIBLE
+
+        results = [None] * len(paths)
+        state = {"remaining": len(paths)}
+
+        def make_callback(index):
+            def job_done(result):
+                if isinstance(result, Exception):
+                    results[index] = \
+                        rabbitvcs.vcs.status.Status.status_error(paths[index])
+                else:
+                    results[index] = result
+
+                state["remaining"] -= 1
+                if state["remaining"] == 0:
+                    callback(results)
+
+                # Don't call us again
+                return False
+            return job_done
+
+        if not paths:
+            gobject.idle_add(callback, [])
+            return
+
+        for (index, path) in enumerate(paths):
+            try:
+                self.worker_for(path).submit(path, recurse, invalidate,
+                                             summary, priority,
+                                             make_callback(index))
+            except Exception, ex:
+                log.exception(ex)
+                gobject.idle_add(make_callback(index), ex)
+
+    def invalidate(self, paths):
+        """ Drops any cached statuses for the given paths, in the workers that
+        own them. Status checks queued afterwards will see the change.
+        """
+        StatusChecker.invalidate(self, paths)
+        for path in paths:
+            self.worker_for(path).invalidate(path)
+
+    def status_caches(self):
+        caches = self.vcs_client.status_caches()
+        for worker in self.workers:
+            caches += worker.vcs_client.status_caches()
+        return caches
+
+    def extra_info(self):
+        info = StatusChecker.extra_info(self)
+        info.append((_("Status workers"), str(len(self.workers))))
+        info.append((_("Queued status checks"),
+                     str(sum([worker.pending() for worker in self.workers]))))
+        return info
+
+    def quit(self):
+        for worker in self.workers:
+            worker.stop()
+
+        for worker in self.workers:
+            worker.join(QUIT_TIMEOUT)
+
+            # Only save what the worker is not still busy with
+            if self.store and not worker.isAlive():
+                try:
+                    worker.save_statuses(self.store)
+                except Exception, ex:
+                    log.exception(ex)
+
+        if self.store:
+            self.store.close()
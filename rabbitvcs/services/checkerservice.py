@@ -45,7 +45,10 @@ code).
 
 import os, os.path
 import sys
+import time
+import struct
 import simplejson
+from collections import OrderedDict
 
 try:
     from gi.repository import GObject as gobject
@@ -66,7 +69,9 @@ import rabbitvcs.util.decorators
 import rabbitvcs.util._locale
 import rabbitvcs.util.helper
 import rabbitvcs.services.service
-from rabbitvcs.services.statuschecker import StatusChecker
+from rabbitvcs.services.checkerpool import StatusCheckerPool
+from rabbitvcs.services.statusstore import StatusStore
+from rabbitvcs.services.watcher import StatusWatcher
 
 import rabbitvcs.vcs.status
 
@@ -80,6 +85,14 @@ OBJECT_PATH = "/org/google/code/rabbitvcs/StatusChecker"
 SERVICE = "org.google.code.rabbitvcs.RabbitVCS.Checker"
 TIMEOUT = 60*15*100 # seconds
 
+# How long a status check can go unanswered before repeated requests stop
+# waiting for it (in seconds)
+PENDING_CHECK_TIMEOUT = 60
+
+# The number of requested paths the service remembers, so that it can send
+# new statuses for them when they change
+MAX_TRACKED_PATHS = 50000
+
 def find_class(module, name):
     """ Given a module name and a class name, return the actual type object.
     """
@@ -112,6 +125,166 @@ def decode_status(json_dict):
         raise TypeError("RabbitVCS status object has no path")
     return st
 
+# The packed wire format is a more compact alternative to JSON, used once both
+# ends of the connection have agreed (via CheckVersion) that they are running
+# the same version of RabbitVCS. Increment this whenever the layout changes.
+WIRE_FORMAT_VERSION = 1
+
+WIRE_HEADER = struct.Struct(">BII")
+WIRE_RECORD = struct.Struct(">BBIIIIIIIIIq")
+WIRE_STRING = struct.Struct(">cI")
+WIRE_INTEGER = struct.Struct(">cq")
+
+WIRE_HAS_DATE = 0x01
+WIRE_RECURSE = 0x02
+WIRE_SUMMARY = 0x04
+
+WIRE_STATUS_ATTRIBUTES = [
+    "path",
+    "content",
+    "metadata",
+    "remote_content",
+    "remote_metadata",
+    "single",
+    "summary",
+    "revision",
+    "author"
+]
+
+def _get_static_wire_values():
+    """ Collects the status kinds known to every status class, so that they
+    can be sent as small fixed codes instead of being put in each reply's
+    value table.
+    """
+    values = [None] + rabbitvcs.vcs.status.StatusCache.keys[1:]
+    for cl in rabbitvcs.vcs.status.STATUS_TYPES:
+        for status_map in (cl.content_status_map, cl.metadata_status_map):
+            if status_map:
+                values += sorted([key for key in status_map if key])
+
+    static_values = []
+    for value in values:
+        if value not in static_values:
+            static_values.append(value)
+
+    return static_values
+
+WIRE_STATIC_VALUES = _get_static_wire_values()
+WIRE_STATIC_CODES = dict([(value, code) for (code, value)
+                            in enumerate(WIRE_STATIC_VALUES)])
+
+def pack_statuses(statuses, check_flags=None):
+    """ Packs a list of status objects into a byte string.
+
+    Every string (and revision) is stored once in a value table at the start of
+    the message, and each status becomes a fixed size record of codes into
+    that table. Status kinds known in advance are never put in the table.
+
+    @param check_flags: the (recurse, summary) flags each status was checked
+                        with, if they are to be sent along (see
+                        unpack_checked_statuses)
+    @type check_flags: a list of tuples, one per status
+    """
+    values = []
+    codes = {}
+
+    def value_code(value):
+        if value in WIRE_STATIC_CODES:
+            return WIRE_STATIC_CODES[value]
+
+        key = (isinstance(value, (int, long)), value)
+        if key not in codes:
+            codes[key] = len(WIRE_STATIC_VALUES) + len(values)
+            values.append(value)
+        return codes[key]
+
+    records = []
+    for (index, status) in enumerate(statuses):
+        flags = 0
+        date = 0
+        if status.date is not None:
+            flags |= WIRE_HAS_DATE
+            date = int(status.date)
+
+        if check_flags:
+            (recurse, summary) = check_flags[index]
+            if recurse:
+                flags |= WIRE_RECURSE
+            if summary:
+                flags |= WIRE_SUMMARY
+
+        record_codes = [value_code(getattr(status, attr, None))
+                            for attr in WIRE_STATUS_ATTRIBUTES]
+
+        records.append(WIRE_RECORD.pack(
+            rabbitvcs.vcs.status.STATUS_TYPES.index(type(status)),
+            flags,
+            *(record_codes + [date])))
+
+    chunks = [WIRE_HEADER.pack(WIRE_FORMAT_VERSION, len(values), len(records))]
+    for value in values:
+        if isinstance(value, (int, long)):
+            chunks.append(WIRE_INTEGER.pack("i", value))
+        else:
+            if isinstance(value, unicode):
+                value = value.encode("utf-8")
+            else:
+                value = str(value)
+            chunks.append(WIRE_STRING.pack("s", len(value)))
+            chunks.append(value)
+
+    chunks += records
+    return "".join(chunks)
+
+def unpack_statuses(data):
+    """ Reconstitutes the list of status objects packed by pack_statuses. """
+    return [status for (status, recurse, summary)
+                in unpack_checked_statuses(data)]
+
+def unpack_checked_statuses(data):
+    """ Like unpack_statuses, but returns a list of (status, recurse, summary)
+    tuples, with the flags each status was checked with (both False if they
+    were not packed).
+    """
+    data = str(data)
+
+    (version, value_count, record_count) = WIRE_HEADER.unpack_from(data, 0)
+    if version != WIRE_FORMAT_VERSION:
+        raise ValueError("Unsupported status wire format version: %s"
+                         % version)
+
+    offset = WIRE_HEADER.size
+    values = list(WIRE_STATIC_VALUES)
+    for index in xrange(value_count):
+        (kind, value) = WIRE_INTEGER.unpack_from(data, offset)
+        if kind == "i":
+            offset += WIRE_INTEGER.size
+        else:
+            (kind, length) = WIRE_STRING.unpack_from(data, offset)
+            offset += WIRE_STRING.size
+            value = data[offset:offset + length].decode("utf-8")
+            offset += length
+        values.append(value)
+
+    statuses = []
+    for index in xrange(record_count):
+        record = WIRE_RECORD.unpack_from(data, offset)
+        offset += WIRE_RECORD.size
+
+        cl = rabbitvcs.vcs.status.STATUS_TYPES[record[0]]
+        state = dict(zip(WIRE_STATUS_ATTRIBUTES,
+                         [values[code] for code in record[2:-1]]))
+        state["date"] = None
+        if record[1] & WIRE_HAS_DATE:
+            state["date"] = record[-1]
+
+        st = cl.__new__(cl)
+        st.__dict__ = state
+        statuses.append((st, bool(record[1] & WIRE_RECURSE),
+                         bool(record[1] & WIRE_SUMMARY)))
+
+    return statuses
+
 class StatusCheckerService(dbus.service.Object):
     """ StatusCheckerService objects wrap a StatusCheckerPlus instance,
     exporting methods that can be called via DBUS.
@@ -141,9 +314,139 @@ class StatusCheckerService(dbus.service.Object):
         
         self.mainloop = mainloop
 
-        # Start the status checking daemon so we can do requests in the
+        # Keep statuses between runs, so that we have something to show
+        # straight away after a restart
+        try:
+            store = StatusStore()
+        except Exception, ex:
+            log.exception(ex)
+            store = None
+
+        # Start the status checking workers so we can do requests in the
         # background
-        self.status_checker = StatusChecker()
+        self.status_checker = StatusCheckerPool(store=store,
+                                                refreshed=self._recheck_paths)
+
+        # Watch the working copies we are asked about, so that we know when
+        # our cached statuses become stale
+        self.watcher = StatusWatcher(self._paths_changed)
+
+        # The paths clients have asked about (least recently asked first),
+        # mapped to the (recurse, summary) flags they were asked with
+        self.tracked_paths = OrderedDict()
+        self.tracked_index = rabbitvcs.vcs.status.PathIndex()
+
+        # Statuses waiting to be sent out in the next StatusesChanged signal,
+        # by path and the (recurse, summary) flags they were checked with
+        self.changed_statuses = OrderedDict()
+        self.changed_pending = False
+
+    def _check_statuses(self, paths, recurse, invalidate, summary, callback,
+                        background=False):
+        """ Has the status checker check the given paths, then calls the
+        callback with the list of statuses (with an error status for any path
+        that could not be checked). The paths are watched for changes from
+        then on.
+        """
+        paths = [unicode(path) for path in paths]
+
+        def statuses_checked(statuses):
+            self.watcher.end_check(paths)
+            for path in paths:
+                self.watcher.watch(path)
+                self._track_path(path, recurse, summary)
+            callback(statuses)
+
+        self.watcher.begin_check(paths)
+        self.status_checker.check_status_many(paths, recurse, summary,
+                                              invalidate, statuses_checked,
+                                              background)
+
+    def _track_path(self, path, recurse, summary):
+        if self.tracked_paths.pop(path, None) is None:
+            self.tracked_index.add(path)
+        self.tracked_paths[path] = (recurse, summary)
+
+        while len(self.tracked_paths) > MAX_TRACKED_PATHS:
+            (old_path, flags) = self.tracked_paths.popitem(last=False)
+            self.tracked_index.remove(old_path)
+
+    def _paths_changed(self, paths):
+        self.status_checker.invalidate(paths)
+        self.StatusesInvalidated(paths)
+        self._recheck_paths(paths)
+
+    def _recheck_paths(self, paths):
+        # Work out new statuses for the tracked paths that are affected (the
+        # changed paths, everything below them and the directories above
+        # them) and push them to clients all at once. Parents are checked
+        # before their children, and recursive checks before the rest, so
+        # that the later checks are answered from the scans of the earlier
+        # ones.
+        affected = set()
+        for path in paths:
+            affected.update(self.tracked_index.iter_subtree(path))
+
+            parent = os.path.dirname(path)
+            while parent != path:
+                if parent in self.tracked_paths:
+                    affected.add(parent)
+                (path, parent) = (parent, os.path.dirname(parent))
+
+        batches = {}
+        for path in sorted(affected):
+            flags = self.tracked_paths[path]
+            batches.setdefault(flags, []).append(path)
+
+        for (recurse, summary) in sorted(batches, reverse=True):
+            batch = batches[(recurse, summary)]
+            self._check_statuses(batch, recurse, False, summary,
+                                 self._make_queue_changed(recurse, summary),
+                                 background=True)
+
+    def _make_queue_changed(self, recurse, summary):
+        return lambda statuses: self._queue_changed(statuses, recurse,
+                                                    summary)
+
+    def _queue_changed(self, statuses, recurse, summary):
+        for status in statuses:
+            key = (status.path, bool(recurse), bool(summary))
+            self.changed_statuses[key] = status
+
+        if not self.changed_pending and self.changed_statuses:
+            self.changed_pending = True
+            gobject.idle_add(self._emit_changed)
+
+    def _emit_changed(self):
+        statuses = self.changed_statuses.values()
+        check_flags = [(recurse, summary) for (path, recurse, summary)
+                            in self.changed_statuses.keys()]
+        self.changed_statuses = OrderedDict()
+        self.changed_pending = False
+
+        self.StatusesChanged(dbus.ByteArray(pack_statuses(statuses,
+                                                          check_flags)))
+
+        # Don't call us again, _queue_changed will reschedule this
+        return False
+
+    @dbus.service.signal(INTERFACE, signature='ay')
+    def StatusesChanged(self, batch):
+        """ Emitted with a batch of new statuses, in the packed wire format
+        (see pack_statuses), each with the flags it was checked with. The
+        batch contains the results of any RequestStatusMany calls, and the
+        new statuses of paths that have changed since clients last asked
+        about them.
+        """
+        pass
+
+    @dbus.service.signal(INTERFACE, signature='as')
+    def StatusesInvalidated(self, paths):
+        """ Emitted when the statuses of the given paths, and of everything
+        below them, may have changed. Clients displaying any of them should
+        ask for their statuses again.
+        """
+        pass
 
     @dbus.service.method(INTERFACE)
     def ExtraInformation(self):
@@ -164,17 +467,63 @@ class StatusCheckerService(dbus.service.Object):
     def CheckerType(self):
         return self.status_checker.CHECKER_NAME
 
-    @dbus.service.method(INTERFACE, in_signature='sbbb', out_signature='s')
+    @dbus.service.method(INTERFACE, out_signature='b')
+    def IsWatching(self):
+        """ Whether the checker watches the filesystem, and so sends out
+        StatusesInvalidated (and StatusesChanged) signals when paths change.
+        """
+        return self.watcher.enabled
+
+    @dbus.service.method(INTERFACE, in_signature='sbbb', out_signature='s',
+                         async_callbacks=('reply_handler', 'error_handler'))
     def CheckStatus(self, path, recurse=False, invalidate=False,
-                      summary=False):
+                      summary=False, reply_handler=None, error_handler=None):
         """ Requests a status check from the underlying status checker.
         """
-        status = self.status_checker.check_status(unicode(path),
-                                                  recurse=recurse,
-                                                  summary=summary,
-                                                  invalidate=invalidate)
-        
-        return self.encoder.encode(status)
+        def statuses_checked(statuses):
+            reply_handler(self.encoder.encode(statuses[0]))
+
+        self._check_statuses([path], recurse, invalidate, summary,
+                             statuses_checked)
+
+    @dbus.service.method(INTERFACE, in_signature='asbbb', out_signature='s',
+                         async_callbacks=('reply_handler', 'error_handler'))
+    def CheckStatusMany(self, paths, recurse=False, invalidate=False,
+                        summary=False, reply_handler=None, error_handler=None):
+        """ Requests status checks for several paths at once, so that a client
+        displaying many items only needs a single round trip. The statuses are
+        returned as a JSON list in the same order as the paths.
+        """
+        def statuses_checked(statuses):
+            reply_handler(self.encoder.encode(statuses))
+
+        self._check_statuses(paths, recurse, invalidate, summary,
+                             statuses_checked)
+
+    @dbus.service.method(INTERFACE, in_signature='asbbb', out_signature='ay',
+                         async_callbacks=('reply_handler', 'error_handler'))
+    def CheckStatusManyPacked(self, paths, recurse=False, invalidate=False,
+                              summary=False, reply_handler=None,
+                              error_handler=None):
+        """ The same as CheckStatusMany, but the statuses are returned in the
+        packed wire format (see pack_statuses) instead of JSON.
+        """
+        def statuses_checked(statuses):
+            reply_handler(dbus.ByteArray(pack_statuses(statuses)))
+
+        self._check_statuses(paths, recurse, invalidate, summary,
+                             statuses_checked)
+
+    @dbus.service.method(INTERFACE, in_signature='asbbb', out_signature='')
+    def RequestStatusMany(self, paths, recurse=False, invalidate=False,
+                          summary=False):
+        """ Requests status checks for several paths. Unlike CheckStatusMany,
+        the statuses are not returned: they are sent out through the next
+        StatusesChanged signal, together with any other statuses found in the
+        meantime.
+        """
+        self._check_statuses(paths, recurse, invalidate, summary,
+                             self._make_queue_changed(recurse, summary))
 
     @dbus.service.method(INTERFACE, in_signature='as', out_signature='s')
     def GenerateMenuConditions(self, paths):
@@ -223,12 +572,41 @@ class StatusCheckerService(dbus.service.Object):
         If calling this programmatically, then you can do "os.waitpid(pid, 0)"
         on the returned PID to prevent a zombie process.
         """
+        self.watcher.quit()
         self.status_checker.quit()
         log.debug("Quitting main loop...")
         self.mainloop.quit()
         return self.PID()
 
 
+class PendingStatusCheck:
+    """ A status check that has been requested through a StatusCheckerStub,
+    but not answered yet.
+    """
+
+    def __init__(self, path, recurse, invalidate, summary):
+        self.path = path
+        self.recurse = recurse
+        self.invalidate = invalidate
+        self.summary = summary
+        self.created = time.time()
+
+        # Whether the check has been sent to the checker (rather than being
+        # queued or waiting for a parent)
+        self.sent = False
+
+        self.callbacks = []
+
+        # Checks for paths below this one, waiting for this (recursive) check
+        # to fill the checker's cache
+        self.children = []
+
+    def is_stale(self):
+        """ Whether the check has gone unanswered for so long that it has
+        probably been lost (eg. because the checker was restarted).
+        """
+        return time.time() - self.created > PENDING_CHECK_TIMEOUT
+
 class StatusCheckerStub:
     """ StatusCheckerStub objects contain methods that call an actual status
     checker running in another process.
@@ -250,9 +628,38 @@ class StatusCheckerStub:
         self.session_bus = dbus.SessionBus()
         self.decoder = simplejson.JSONDecoder(object_hook=decode_status)
         self.status_checker = None
+
+        # Whether the checker is known to understand the packed wire format,
+        # this is only set once the versions have been compared
+        self.use_packed = False
+
+        # Status checks requested with a callback are queued here and sent to
+        # the checker together, once per main loop iteration
+        self.queued_checks = []
+        self.flush_pending = False
+
+        # The checks that have been requested but not answered yet, by path,
+        # so that repeated requests can share them
+        self.pending_checks = {}
+
+        # When using the packed format, statuses are requested with
+        # RequestStatusMany and arrive through the StatusesChanged signal.
+        # These are the (time requested, callback) pairs waiting for them, by
+        # (path, recurse, summary) like the checks they were requested with,
+        # and the listeners for statuses nobody is waiting for.
+        self.waiting = {}
+        self.expiry_pending = False
+        self.changed_listeners = []
+
         start()
         self._connect_to_checker()
 
+        self.session_bus.add_signal_receiver(self._statuses_changed,
+                                             signal_name="StatusesChanged",
+                                             dbus_interface=INTERFACE,
+                                             path=OBJECT_PATH,
+                                             byte_arrays=True)
+
     def _connect_to_checker(self):
 
         # Start the status checker, if it's not running this should start it up.
@@ -274,43 +681,121 @@ class StatusCheckerStub:
         is quit and restarted.
         
         Note that if the version of the newly started checker still doesn't
-        match, nothing is done. 
+        match, nothing is done, except that the JSON format will be used to
+        talk to it.
         """
+        self.use_packed = False
+
         try:
             pid = self.status_checker.CheckVersionOrDie(version)
         except dbus.DBusException, ex:
             log.exception(ex)
             self._connect_to_checker()
         else:
-            if pid is not None:
+            if pid is None:
+                self.use_packed = True
+            else:
                 try:
                     os.waitpid(pid, 0)
                 except OSError:
                     # Process already gone...
                     pass
+
+                # The old checker will never answer these
+                self._fail_waiting(self.waiting.keys())
+
                 start()
                 self._connect_to_checker()
                 
                 try:
-                    if not self.status_checker.CheckVersion(version):
+                    if self.status_checker.CheckVersion(version):
+                        self.use_packed = True
+                    else:
                         log.warning("Version mismatch even after restart!")
                 except dbus.DBusException, ex:
                     log.exception(ex)
                     self._connect_to_checker()
                     
 
+    def is_watching(self):
+        """ Whether the checker tells us when statuses change (see
+        connect_statuses_invalidated), so that there is no need to have it
+        check items again just because we are looking at them again.
+        """
+        try:
+            return bool(self.status_checker.IsWatching(
+                                dbus_interface=INTERFACE, timeout=TIMEOUT))
+        except dbus.DBusException, ex:
+            # Older checkers don't watch anything
+            log.debug(ex)
+            return False
+
+    def connect_statuses_invalidated(self, callback):
+        """ Calls the given callback with a list of paths whenever the checker
+        finds out that the statuses of those paths (and of everything below
+        them) may have changed.
+
+        The signal receiver is not tied to the current checker process, so it
+        keeps working if the checker is restarted.
+        """
+        self.session_bus.add_signal_receiver(callback,
+                                             signal_name="StatusesInvalidated",
+                                             dbus_interface=INTERFACE,
+                                             path=OBJECT_PATH)
+
+    def connect_statuses_changed(self, callback):
+        """ Calls the given callback with a list of statuses whenever the
+        checker sends out new statuses that no status check is waiting for
+        (eg. because the paths have changed on disk).
+
+        This only works if the checker understands the packed wire format,
+        see use_packed.
+        """
+        self.changed_listeners.append(callback)
+
+    def _statuses_changed(self, batch):
+        # The callbacks should be performed as a low priority task, so we
+        # keep Nautilus as responsive as possible.
+        gobject.idle_add(self._dispatch_statuses_changed, batch)
+
+    def _dispatch_statuses_changed(self, batch):
+        unclaimed = []
+        for (status, recurse, summary) in unpack_checked_statuses(batch):
+            callbacks = self.waiting.pop((status.path, recurse, summary), None)
+            if callbacks:
+                for (requested, callback) in callbacks:
+                    callback(status)
+            else:
+                unclaimed.append(status)
+
+        if unclaimed:
+            for listener in self.changed_listeners:
+                listener(unclaimed)
+
+        # Don't call us again
+        return False
+
     def check_status_now(self, path, recurse=False, invalidate=False,
                        summary=False):
         
         status = None
                 
         try:
-            json_status = self.status_checker.CheckStatus(path,
+            if self.use_packed:
+                packed = self.status_checker.CheckStatusManyPacked([path],
+                                                        recurse, invalidate,
+                                                        summary,
+                                                        dbus_interface=INTERFACE,
+                                                        timeout=TIMEOUT,
+                                                        byte_arrays=True)
+                status = unpack_statuses(packed)[0]
+            else:
+                json_status = self.status_checker.CheckStatus(path,
                                                           recurse, invalidate,
                                                           summary,
                                                           dbus_interface=INTERFACE,
                                                           timeout=TIMEOUT)
-            status = self.decoder.decode(json_status)
+                status = self.decoder.decode(json_status)
             # Test client error problems :)
             # raise dbus.DBusException("Test")
         except dbus.DBusException, ex:
@@ -323,42 +808,235 @@ class StatusCheckerStub:
 
         return status
         
-    def check_status_later(self, path, callback, recurse=False,
-                           invalidate=False, summary=False):
-        
-        def real_reply_handler(json_status):
-            # Note that this a closure referring to the outer functions callback
-            # parameter
-            status = self.decoder.decode(json_status)
-            assert status.path == path, "Status check returned the wrong path "\
-                                        "(asked about %s, got back %s)" % \
-                                        (path, status.path)
-            callback(status)
-        
+    def check_status_many_later(self, requests, recurse=False,
+                                invalidate=False, summary=False):
+        """ Sends a single CheckStatusMany call for a list of (path, callback)
+        requests that share the same flags. Each callback is called with the
+        status for its own path.
+        """
+        if self.use_packed:
+            self.request_status_many(requests, recurse, invalidate, summary)
+            return
+
+        paths = [path for (path, callback) in requests]
+
+        def real_reply_handler(reply):
+            statuses = self.decoder.decode(reply)
+            if len(statuses) != len(requests):
+                log.warning("Status check returned %i statuses for %i paths"
+                            % (len(statuses), len(requests)))
+
+            # A bad status only affects its own path
+            for (index, (path, callback)) in enumerate(requests):
+                status = None
+                if index < len(statuses):
+                    status = statuses[index]
+
+                if status is None or status.path != path:
+                    log.warning("Status check returned the wrong path "
+                                "(asked about %s, got back %s)"
+                                % (path, status and status.path))
+                    status = rabbitvcs.vcs.status.Status.status_error(path)
+
+                callback(status)
+
         def reply_handler(*args, **kwargs):
-            # The callback should be performed as a low priority task, so we
+            # The callbacks should be performed as a low priority task, so we
             # keep Nautilus as responsive as possible.
             gobject.idle_add(real_reply_handler, *args, **kwargs)
-        
+
         def error_handler(dbus_ex):
             log.exception(dbus_ex)
             self._connect_to_checker()
-            callback(rabbitvcs.vcs.status.Status.status_error(path))
-        
+            for (path, callback) in requests:
+                callback(rabbitvcs.vcs.status.Status.status_error(path))
+
         try:
-            self.status_checker.CheckStatus(path,
-                                            recurse, invalidate,
-                                            summary,
-                                            dbus_interface=INTERFACE,
-                                            timeout=TIMEOUT,
-                                            reply_handler=reply_handler,
-                                            error_handler=error_handler)
+            self.status_checker.CheckStatusMany(paths,
+                                                recurse, invalidate,
+                                                summary,
+                                                dbus_interface=INTERFACE,
+                                                timeout=TIMEOUT,
+                                                reply_handler=reply_handler,
+                                                error_handler=error_handler)
+        except dbus.DBusException, ex:
+            log.exception(ex)
+            for (path, callback) in requests:
+                callback(rabbitvcs.vcs.status.Status.status_error(path))
+            # Try to reconnect
+            self._connect_to_checker()
+
+    def request_status_many(self, requests, recurse=False, invalidate=False,
+                            summary=False):
+        """ Like check_status_many_later, but the statuses are delivered
+        through the StatusesChanged signal (along with any other statuses
+        the checker sends out) rather than in the reply.
+        """
+        self._expire_waiting()
+
+        now = time.time()
+        paths = []
+        keys = []
+        for (path, callback) in requests:
+            key = (path, bool(recurse), bool(summary))
+            paths.append(path)
+            keys.append(key)
+            self.waiting.setdefault(key, []).append((now, callback))
+
+        if not self.expiry_pending:
+            self.expiry_pending = True
+            gobject.timeout_add(PENDING_CHECK_TIMEOUT * 1000,
+                                self._expire_waiting_later)
+
+        def reply_handler():
+            pass
+
+        def error_handler(dbus_ex):
+            log.exception(dbus_ex)
+            self._connect_to_checker()
+            self._fail_waiting(keys)
+
+        try:
+            self.status_checker.RequestStatusMany(paths,
+                                                  recurse, invalidate,
+                                                  summary,
+                                                  dbus_interface=INTERFACE,
+                                                  timeout=TIMEOUT,
+                                                  reply_handler=reply_handler,
+                                                  error_handler=error_handler)
         except dbus.DBusException, ex:
             log.exception(ex)
-            callback(rabbitvcs.vcs.status.Status.status_error(path))
+            self._fail_waiting(keys)
             # Try to reconnect
             self._connect_to_checker()
 
+    def _fail_waiting(self, keys):
+        for key in keys:
+            for (requested, callback) in self.waiting.pop(key, []):
+                callback(rabbitvcs.vcs.status.Status.status_error(key[0]))
+
+    def _expire_waiting(self):
+        """ Gives up on the statuses that have been waited for so long that
+        they have probably been lost (see PendingStatusCheck.is_stale).
+        """
+        cutoff = time.time() - PENDING_CHECK_TIMEOUT
+        for key in self.waiting.keys():
+            callbacks = self.waiting[key]
+            expired = [callback for (requested, callback) in callbacks
+                            if requested < cutoff]
+            if not expired:
+                continue
+
+            callbacks = [(requested, callback)
+                            for (requested, callback) in callbacks
+                                if requested >= cutoff]
+            if callbacks:
+                self.waiting[key] = callbacks
+            else:
+                del self.waiting[key]
+
+            for callback in expired:
+                callback(rabbitvcs.vcs.status.Status.status_error(key[0]))
+
+    def _expire_waiting_later(self):
+        self._expire_waiting()
+
+        # Keep checking for as long as anything is waiting
+        self.expiry_pending = bool(self.waiting)
+        return self.expiry_pending
+
+    def queue_status_check(self, path, callback, recurse=False,
+                           invalidate=False, summary=False):
+        """ Queues a status check. Every check queued during the same main
+        loop iteration is sent to the checker in one DBUS call (see
+        flush_status_checks).
+
+        If a check for the same path (with the same recurse and summary
+        flags) has not been answered yet, the callback is attached to it
+        instead. If a recursive check for the directory containing the path
+        has not been answered yet, the check waits for it and is then only
+        sent invalidating if the parent's check was not, since otherwise the
+        checker will have just scanned the path.
+        """
+        check = self.pending_checks.get(path)
+        if check and check.is_stale():
+            del self.pending_checks[path]
+            check = None
+
+        if check and check.recurse == recurse and check.summary == summary:
+            if not check.sent:
+                check.invalidate = check.invalidate or invalidate
+            check.callbacks.append(callback)
+            return
+
+        check = PendingStatusCheck(path, recurse, invalidate, summary)
+        check.callbacks.append(callback)
+
+        # If there is a different check for this path in flight, this one is
+        # sent separately and not remembered
+        if path not in self.pending_checks:
+            self.pending_checks[path] = check
+
+            parent = self._find_pending_parent(path)
+            if parent:
+                parent.children.append(check)
+                return
+
+        self._queue_check(check)
+
+    def _find_pending_parent(self, path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+
+        check = self.pending_checks.get(parent)
+        if check and check.recurse and not check.is_stale():
+            return check
+        return None
+
+    def _queue_check(self, check):
+        self.queued_checks.append(check)
+
+        if not self.flush_pending:
+            self.flush_pending = True
+            gobject.idle_add(self.flush_status_checks)
+
+    def _check_done(self, check, status):
+        if self.pending_checks.get(check.path) is check:
+            del self.pending_checks[check.path]
+
+        for callback in check.callbacks:
+            callback(status)
+
+        # The parent's scan only covers its children if it succeeded
+        covered = (status is not None
+                    and status.content != rabbitvcs.vcs.status.status_error)
+        for child in check.children:
+            if covered:
+                child.invalidate = child.invalidate and not check.invalidate
+            self._queue_check(child)
+
+    def flush_status_checks(self):
+        """ Sends all of the queued status checks, grouped by their flags. """
+        checks = self.queued_checks
+        self.queued_checks = []
+        self.flush_pending = False
+
+        batches = {}
+        for check in checks:
+            check.sent = True
+            flags = (check.recurse, check.invalidate, check.summary)
+            callback = lambda status, check=check: \
+                            self._check_done(check, status)
+            batches.setdefault(flags, []).append((check.path, callback))
+
+        for (recurse, invalidate, summary), requests in batches.items():
+            self.check_status_many_later(requests, recurse, invalidate,
+                                         summary)
+
+        # Don't call us again, queue_status_check will reschedule this
+        return False
+
     # @rabbitvcs.util.decorators.deprecated
     # Can't decide whether this should be deprecated or not... -JH
     def check_status(self, path, recurse=False, invalidate=False,
@@ -367,10 +1045,13 @@ class StatusCheckerStub:
 
         This is a pass-through method to the check_status method of the DBUS
         service (which is, in turn, a wrapper around the real status checker).
+
+        If a callback is given, the check is queued and batched together with
+        any other checks requested in the same main loop iteration.
         """
         if callback:
-            gobject.idle_add(self.check_status_later,
-                     path, callback, recurse, invalidate, summary)
+            self.queue_status_check(path, callback, recurse, invalidate,
+                                    summary)
             return rabbitvcs.vcs.status.Status.status_calc(path)
         else:
             return self.check_status_now(path, recurse, invalidate, summary)
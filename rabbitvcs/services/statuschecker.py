@@ -49,14 +49,41 @@ class StatusChecker:
         path_status = self.vcs_client.status(path, summary, invalidate)
         return path_status
     
+    def invalidate(self, paths):
+        """ Drops any cached statuses for the given paths. """
+        for path in paths:
+            self.vcs_client.invalidate(path)
+
     def generate_menu_conditions(self, paths, invalidate=False):
         from rabbitvcs.util.contextmenu import MainContextMenuConditions
         
         conditions = MainContextMenuConditions(self.vcs_client, paths)
         return conditions.path_dict
     
+    def status_caches(self):
+        """ Returns the status caches used by this checker. """
+        return self.vcs_client.status_caches()
+
     def extra_info(self):
-        return None
+        totals = {
+            "entries": 0,
+            "bytes": 0,
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0
+        }
+
+        for cache in self.status_caches():
+            for key, value in cache.statistics().items():
+                totals[key] += value
+
+        return [
+            (_("Cached statuses"), str(totals["entries"])),
+            (_("Status cache size"), "%i KB" % (totals["bytes"] / 1024)),
+            (_("Status cache hits"), str(totals["hits"])),
+            (_("Status cache misses"), str(totals["misses"])),
+            (_("Status cache evictions"), str(totals["evictions"]))
+        ]
     
     def get_memory_usage(self):
         """ Returns any additional memory of any subprocesses used by this
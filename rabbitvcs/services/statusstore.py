@@ -0,0 +1,173 @@
+#
+# This is an extension to the Nautilus file manager to allow better
+# integration with the Subversion source control system.
+#
+# Copyright (C) 2006-2008 by Jason Field <jason@jasonfield.com>
+# Copyright (C) 2007-2008 by Bruce van der Kooij <brucevdkooij@gmail.com>
+# Copyright (C) 2008-2010 by Adam Plumb <adamplumb@gmail.com>
+#
+# RabbitVCS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# RabbitVCS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RabbitVCS;  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" On-disk storage for the statuses of working copies.
+
+The checker service keeps the statuses of the working copies it has seen in
+an sqlite database in the user's RabbitVCS folder, so that they are available
+straight away when it is restarted (eg. after logging in, or after an upgrade).
+
+There is one row per working copy root, holding its statuses in the packed
+wire format (see rabbitvcs.services.checkerservice.pack_statuses) along with
+a stamp of the working copy's metadata files (eg. .svn/wc.db, .git/index,
+.hg/dirstate). If the stamp no longer matches when the statuses are loaded,
+they are thrown away.
+"""
+
+import os.path
+import sqlite3
+import threading
+
+import rabbitvcs.util.helper
+from rabbitvcs.services.watcher import METADATA_FILES
+
+from rabbitvcs.util.log import Log
+log = Log("rabbitvcs.services.statusstore")
+
+# Bump this whenever the layout of the database changes
+STORE_VERSION = 1
+
+def get_stamp(root, vcs):
+    """
+    Returns a string describing the state of the metadata files of the given
+    working copy (their sizes and modification times), or None if it has
+    none of them.
+    """
+    if vcs not in METADATA_FILES:
+        return None
+
+    (admin_dir, filenames) = METADATA_FILES[vcs]
+
+    parts = []
+    for filename in filenames:
+        try:
+            st = os.stat(os.path.join(root, admin_dir, filename))
+        except OSError:
+            continue
+        parts.append("%s:%r:%i" % (filename, st.st_mtime, st.st_size))
+
+    if not parts:
+        return None
+
+    return ";".join(parts)
+
+class StatusStore:
+    """ Saves and loads the statuses of working copies. The store can be used
+    from several threads at once.
+    """
+
+    def __init__(self, filename=None):
+        """
+        @param filename: the database file (by default, statuses.db in the
+                         user's RabbitVCS folder)
+        @type filename: string
+        """
+        if filename is None:
+            filename = os.path.join(rabbitvcs.util.helper.get_home_folder(),
+                                    "statuses.db")
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != STORE_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS working_copies")
+            self.connection.execute("PRAGMA user_version = %i"
+                                    % STORE_VERSION)
+
+        self.connection.execute("CREATE TABLE IF NOT EXISTS working_copies ("
+                                "root TEXT PRIMARY KEY, "
+                                "vcs TEXT NOT NULL, "
+                                "stamp TEXT NOT NULL, "
+                                "statuses BLOB NOT NULL)")
+        self.connection.commit()
+
+    def load(self, root, vcs):
+        """
+        Returns the stored statuses for the given working copy, or None if
+        there are none or they are out of date.
+        """
+        from rabbitvcs.services.checkerservice import unpack_statuses
+
+        self.lock.acquire()
+        try:
+            row = self.connection.execute("SELECT vcs, stamp, statuses "
+                                          "FROM working_copies "
+                                          "WHERE root = ?",
+                                          (root,)).fetchone()
+        finally:
+            self.lock.release()
+
+        if row is None:
+            return None
+
+        (stored_vcs, stamp, data) = row
+        if stored_vcs != vcs or stamp != get_stamp(root, vcs):
+            log.debug("Stored statuses for %s are out of date" % root)
+            self.remove(root)
+            return None
+
+        try:
+            return unpack_statuses(data)
+        except Exception, ex:
+            log.exception(ex)
+            self.remove(root)
+            return None
+
+    def save(self, root, vcs, statuses):
+        """ Stores the statuses for the given working copy, replacing any
+        that were stored before.
+        """
+        from rabbitvcs.services.checkerservice import pack_statuses
+
+        stamp = get_stamp(root, vcs)
+        if stamp is None:
+            return
+
+        data = sqlite3.Binary(pack_statuses(statuses))
+
+        self.lock.acquire()
+        try:
+            self.connection.execute("INSERT OR REPLACE INTO working_copies "
+                                    "(root, vcs, stamp, statuses) "
+                                    "VALUES (?, ?, ?, ?)",
+                                    (root, vcs, stamp, data))
+            self.connection.commit()
+        finally:
+            self.lock.release()
+
+    def remove(self, root):
+        """ Forgets the statuses for the given working copy. """
+        self.lock.acquire()
+        try:
+            self.connection.execute("DELETE FROM working_copies "
+                                    "WHERE root = ?", (root,))
+            self.connection.commit()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.connection.close()
+        finally:
+            self.lock.release()
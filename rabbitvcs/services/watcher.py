@@ -0,0 +1,322 @@
+#
+# This is an extension to the Nautilus file manager to allow better
+# integration with the Subversion source control system.
+#
+# Copyright (C) 2006-2008 by Jason Field <jason@jasonfield.com>
+# Copyright (C) 2007-2008 by Bruce van der Kooij <brucevdkooij@gmail.com>
+# Copyright (C) 2008-2010 by Adam Plumb <adamplumb@gmail.com>
+#
+# RabbitVCS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# RabbitVCS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RabbitVCS;  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Filesystem watching for the status checker.
+
+The checker service uses a StatusWatcher to find out when the statuses it has
+cached become stale. Every directory the checker is asked about is watched
+(non-recursively) with inotify, as is the administrative directory of its
+working copy, so that:
+
+    - a change to an item only invalidates that item (and the summaries of the
+      directories above it)
+    - a change to the VCS metadata (eg. .svn/wc.db, .git/index, .hg/dirstate)
+      invalidates the whole working copy
+
+Events are coalesced for a short while before the callback is called, so that
+something like a build or a checkout does not cause a storm of invalidations.
+
+Status checks can rewrite the metadata themselves (eg. "git status" refreshes
+the stat data in .git/index). The checker tells the watcher when it starts and
+finishes checking (see begin_check and end_check), and changes to the metadata
+made while a check was running are not reported, so that a check does not
+cause another one.
+
+The watcher needs pyinotify. Without it, watch() does nothing and statuses are
+only refreshed when clients ask for it.
+"""
+
+import os.path
+from collections import OrderedDict
+
+try:
+    import pyinotify
+    HAS_PYINOTIFY = True
+except ImportError:
+    HAS_PYINOTIFY = False
+
+try:
+    from gi.repository import GObject as gobject
+except ImportError:
+    import gobject
+
+import rabbitvcs.vcs
+
+from rabbitvcs.util.log import Log
+log = Log("rabbitvcs.services.watcher")
+
+# The administrative directory of each VCS, and the files in it that are
+# rewritten whenever the state of the working copy changes
+METADATA_FILES = {
+    rabbitvcs.vcs.VCS_SVN: (".svn", ["wc.db", "entries"]),
+    rabbitvcs.vcs.VCS_GIT: (".git", ["index", "HEAD"]),
+    rabbitvcs.vcs.VCS_MERCURIAL: (".hg", ["dirstate"])
+}
+
+ADMIN_DIRECTORIES = [admin_dir for (admin_dir, files)
+                        in METADATA_FILES.values()]
+
+# How long to wait for more events before calling back (in milliseconds)
+COALESCE_DELAY = 250
+
+# Stay well below the default per-user inotify limit (8192)
+MAX_WATCHES = 4096
+
+if HAS_PYINOTIFY:
+    DIRECTORY_MASK = (pyinotify.IN_CREATE | pyinotify.IN_DELETE |
+                      pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_FROM |
+                      pyinotify.IN_MOVED_TO | pyinotify.IN_ATTRIB)
+
+    METADATA_MASK = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO |
+                     pyinotify.IN_DELETE)
+
+class StatusWatcher:
+    """ Watches the directories the checker has statuses for, and reports the
+    paths whose statuses have become stale.
+    """
+
+    def __init__(self, callback):
+        """
+        @param callback: called with a list of paths whose statuses (and
+                         those of everything below them) are stale
+        @type callback: a callable taking a single list argument
+        """
+        self.callback = callback
+
+        # Watched directories, least recently used first
+        self.watches = OrderedDict()
+
+        # Working copy roots whose metadata is watched, mapped to their VCS
+        self.roots = {}
+
+        self.pending = set()
+        self.flush_source = None
+
+        # Working copy roots whose metadata has changed, waiting to be
+        # reported once no check is running in them
+        self.pending_roots = set()
+
+        # The number of checks running in each working copy root, with the
+        # stamp of its metadata from before the first of them started
+        self.checking = {}
+
+        # The stamps of metadata written by our own checks, by root
+        self.own_stamps = {}
+
+        self.enabled = HAS_PYINOTIFY
+        if self.enabled:
+            self.manager = pyinotify.WatchManager()
+            self.notifier = pyinotify.Notifier(self.manager,
+                                               self._process_event,
+                                               timeout=0)
+            gobject.io_add_watch(self.manager.get_fd(), gobject.IO_IN,
+                                 self._on_events)
+        else:
+            log.debug("pyinotify is not available, not watching for changes")
+
+    def watch(self, path):
+        """ Starts watching the directory containing the given path (or the
+        path itself, for directories) and its working copy's metadata.
+        """
+        if not self.enabled:
+            return
+
+        if os.path.isdir(path):
+            directory = path
+        else:
+            directory = os.path.dirname(path)
+
+        if directory in self.watches:
+            self.watches[directory] = self.watches.pop(directory)
+            return
+
+        guess = rabbitvcs.vcs.guess(directory)
+        if guess["vcs"] not in METADATA_FILES:
+            return
+
+        root = guess["repo_path"]
+        if root not in self.roots:
+            admin_dir = os.path.join(root, METADATA_FILES[guess["vcs"]][0])
+            if self._add_watch(admin_dir, METADATA_MASK):
+                self.roots[root] = guess["vcs"]
+
+        self._add_watch(directory, DIRECTORY_MASK)
+
+    def _add_watch(self, directory, mask):
+        try:
+            result = self.manager.add_watch(directory, mask, quiet=False)
+        except pyinotify.WatchManagerError, ex:
+            log.debug("Could not watch %s: %s" % (directory, ex))
+            return False
+
+        self.watches[directory] = result[directory]
+
+        while len(self.watches) > MAX_WATCHES:
+            (old_directory, wd) = self.watches.popitem(last=False)
+            self.manager.rm_watch(wd, quiet=True)
+            self._forget_root(old_directory)
+
+        return True
+
+    def _forget_root(self, directory):
+        if os.path.basename(directory) in ADMIN_DIRECTORIES:
+            self.roots.pop(os.path.dirname(directory), None)
+
+    def _on_events(self, source, condition):
+        self.notifier.read_events()
+        self.notifier.process_events()
+
+        # Keep this IO watch
+        return True
+
+    def _process_event(self, event):
+        if event.mask & pyinotify.IN_IGNORED:
+            # The watched directory has gone away
+            self.watches.pop(event.path, None)
+            self._forget_root(event.path)
+            return
+
+        if os.path.basename(event.path) in ADMIN_DIRECTORIES:
+            root = os.path.dirname(event.path)
+            vcs = self.roots.get(root)
+            if vcs and event.name in METADATA_FILES[vcs][1]:
+                self.pending_roots.add(root)
+                self._schedule_flush()
+            return
+
+        if event.name in ADMIN_DIRECTORIES:
+            return
+
+        self._queue(event.pathname)
+
+    def _queue(self, path):
+        self.pending.add(path)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self.flush_source is None:
+            self.flush_source = gobject.timeout_add(COALESCE_DELAY,
+                                                    self._flush)
+
+    def _metadata_stamp(self, root):
+        """ Returns the (mtime, size, inode) of each metadata file of the
+        given working copy root.
+        """
+        (admin_dir, names) = METADATA_FILES[self.roots[root]]
+        stamp = []
+        for name in names:
+            try:
+                st = os.stat(os.path.join(root, admin_dir, name))
+                stamp.append((st.st_mtime, st.st_size, st.st_ino))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _find_root(self, path):
+        while path not in self.roots:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+        return path
+
+    def begin_check(self, paths):
+        """ Notes that the statuses of the given paths are being checked, so
+        that changes the check makes to their metadata can be told apart.
+        """
+        if not self.enabled:
+            return
+
+        for path in paths:
+            root = self._find_root(path)
+            if root is None:
+                continue
+
+            if root in self.checking:
+                self.checking[root][0] += 1
+            else:
+                self.checking[root] = [1, self._metadata_stamp(root)]
+
+    def end_check(self, paths):
+        """ Notes that a check started with begin_check has finished. If the
+        metadata changed while it ran, the change is put down to the check.
+        """
+        if not self.enabled:
+            return
+
+        for path in paths:
+            root = self._find_root(path)
+            if root not in self.checking:
+                continue
+
+            self.checking[root][0] -= 1
+            if self.checking[root][0] > 0:
+                continue
+
+            before = self.checking.pop(root)[1]
+            after = self._metadata_stamp(root)
+            if after != before:
+                self.own_stamps[root] = after
+
+            if root in self.pending_roots:
+                self._schedule_flush()
+
+    def _flush(self):
+        self.flush_source = None
+
+        # Metadata changes are reported unless they were made by one of our
+        # own checks, and are held back while a check is running
+        for root in list(self.pending_roots):
+            if root in self.checking:
+                continue
+
+            self.pending_roots.discard(root)
+            if root not in self.roots:
+                continue
+
+            if self.own_stamps.pop(root, None) != self._metadata_stamp(root):
+                self.pending.add(root)
+
+        pending = sorted(self.pending)
+        self.pending = set()
+        if not pending:
+            return False
+
+        # Leave out paths that are below another stale path, since their
+        # statuses are invalidated along with it
+        paths = []
+        for path in pending:
+            if paths and path.startswith(paths[-1] + os.sep):
+                continue
+            paths.append(path)
+
+        try:
+            self.callback(paths)
+        except Exception, ex:
+            log.exception(ex)
+
+        # Don't call us again until more events arrive
+        return False
+
+    def quit(self):
+        if self.enabled:
+            self.notifier.stop()
@@ -0,0 +1,122 @@
+#
+# This is an extension to the Nautilus file manager to allow better
+# integration with the Subversion source control system.
+#
+# Copyright (C) 2006-2008 by Jason Field <jason@jasonfield.com>
+# Copyright (C) 2007-2008 by Bruce van der Kooij <brucevdkooij@gmail.com>
+# Copyright (C) 2008-2010 by Adam Plumb <adamplumb@gmail.com>
+#
+# RabbitVCS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# RabbitVCS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RabbitVCS;  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Unit tests for the status checker service's packed wire format.
+
+"""
+
+# make sure the current working copy is in sys.path before anything else
+from os.path import abspath, dirname, join, normpath
+import sys
+toplevel = normpath(join(dirname(abspath(__file__)), '..', '..'))
+sys.path.insert(0, toplevel)
+
+from unittest import TestCase, main
+
+from rabbitvcs.services.checkerservice import pack_statuses, \
+    unpack_statuses, unpack_checked_statuses, WIRE_RECORD, WIRE_STRING
+from rabbitvcs.vcs.status import Status, SVNStatus, GitStatus, \
+    MercurialStatus
+
+
+def make_status(cl, path, content, metadata=None, summary=None,
+                revision=None, author=None, date=None):
+    """
+    Builds a status of the given class without going through the VCS
+    specific constructors, the way unpack_statuses does.
+
+    """
+    st = cl.__new__(cl)
+    Status.__init__(st, path, content, metadata, summary, revision, author,
+                    date)
+    return st
+
+
+class PackStatusesTest(TestCase):
+    """
+    Statuses must come out of unpack_statuses as they went into
+    pack_statuses.
+
+    """
+    def assertSameStatus(self, first, second):
+        self.assertEqual(type(first), type(second))
+        self.assertEqual(first.__getstate__(), second.__getstate__())
+
+    def test_round_trip(self):
+        statuses = [
+            make_status(Status, u"/path/to/wc", "normal"),
+            make_status(SVNStatus, u"/path/to/wc/a", "modified", "normal",
+                        summary="modified", revision=1234, author=u"jason",
+                        date=1262304000),
+            make_status(GitStatus, u"/path/to/wc/b", "added",
+                        revision=u"4b825dc642cb6eb9a060e54bf8d69288fbee4904",
+                        author=u"adam"),
+            make_status(MercurialStatus, u"/path/to/wc/\u00e9t\u00e9",
+                        "unversioned", author=u"adam", date=0),
+            Status.status_error(u"/path/to/wc/c")
+        ]
+
+        unpacked = unpack_statuses(pack_statuses(statuses))
+        self.assertEqual(len(unpacked), len(statuses))
+        for (st, unpacked_st) in zip(statuses, unpacked):
+            self.assertSameStatus(st, unpacked_st)
+
+    def test_empty(self):
+        self.assertEqual(unpack_statuses(pack_statuses([])), [])
+
+    def test_shared_values(self):
+        """Repeated strings are only stored once."""
+        statuses = [make_status(Status, u"/wc/%i" % i, "normal",
+                                author=u"bruce") for i in range(10)]
+        one = len(pack_statuses(statuses[:1]))
+        ten = len(pack_statuses(statuses))
+
+        # Each extra status only adds its record and its own path
+        path_size = WIRE_STRING.size + len(u"/wc/0")
+        self.assertEqual(ten - one, 9 * (WIRE_RECORD.size + path_size))
+
+    def test_check_flags(self):
+        statuses = [make_status(Status, u"/wc/a", "normal"),
+                    make_status(Status, u"/wc/b", "normal"),
+                    make_status(Status, u"/wc/c", "normal")]
+        flags = [(True, False), (False, True), (False, False)]
+
+        checked = unpack_checked_statuses(pack_statuses(statuses, flags))
+        self.assertEqual([(st.path, recurse, summary)
+                            for (st, recurse, summary) in checked],
+                         [(u"/wc/a", True, False), (u"/wc/b", False, True),
+                          (u"/wc/c", False, False)])
+
+        # Without flags, both read back as False
+        checked = unpack_checked_statuses(pack_statuses(statuses))
+        self.assertEqual([(recurse, summary)
+                            for (st, recurse, summary) in checked],
+                         [(False, False)] * 3)
+
+    def test_bad_version(self):
+        data = pack_statuses([make_status(Status, u"/wc", "normal")])
+        self.assertRaises(ValueError, unpack_statuses, chr(255) + data[1:])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#
+# This is an extension to the Nautilus file manager to allow better
+# integration with the Subversion source control system.
+#
+# Copyright (C) 2006-2008 by Jason Field <jason@jasonfield.com>
+# Copyright (C) 2007-2008 by Bruce van der Kooij <brucevdkooij@gmail.com>
+# Copyright (C) 2008-2010 by Adam Plumb <adamplumb@gmail.com>
+#
+# RabbitVCS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# RabbitVCS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RabbitVCS;  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Unit tests for the status store, and for loading the status checker workers'
+caches from it.
+
+"""
+
+# make sure the current working copy is in sys.path before anything else
+from os.path import abspath, dirname, join, normpath
+import sys
+toplevel = normpath(join(dirname(abspath(__file__)), '..', '..'))
+sys.path.insert(0, toplevel)
+
+from unittest import TestCase, main
+import os
+import shutil
+import subprocess
+import tempfile
+
+import rabbitvcs.vcs
+from rabbitvcs.services.statusstore import StatusStore
+from rabbitvcs.services.checkerpool import StatusWorker
+from rabbitvcs.vcs.status import Status, GitStatus, status_normal, \
+    status_modified, status_unversioned
+
+
+def git(root, *args):
+    subprocess.check_call(["git", "-c", "user.name=Test",
+                           "-c", "user.email=test@example.com"] + list(args),
+                          cwd=root)
+
+
+def write(path, text):
+    f = open(path, "w")
+    f.write(text)
+    f.close()
+
+
+def make_status(path, content):
+    st = GitStatus.__new__(GitStatus)
+    Status.__init__(st, path, content)
+    return st
+
+
+class StatusStoreTestCase(TestCase):
+    """
+    Sets up a git working copy with a committed file, and an empty store.
+
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.root = join(self.directory, "wc")
+        os.mkdir(self.root)
+        git(self.root, "init", "-q")
+        write(join(self.root, "a"), "a\n")
+        git(self.root, "add", "a")
+        git(self.root, "commit", "-q", "-m", "Add a")
+
+        self.store = StatusStore(join(self.directory, "statuses.db"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def touch_index(self):
+        """Changes the stamp of the working copy's metadata."""
+        index = join(self.root, ".git", "index")
+        stamp = os.stat(index).st_mtime + 10
+        os.utime(index, (stamp, stamp))
+
+
+class StatusStoreTest(StatusStoreTestCase):
+
+    def test_load_saved(self):
+        statuses = [make_status(self.root, "normal"),
+                    make_status(join(self.root, "a"), "modified")]
+        self.store.save(self.root, rabbitvcs.vcs.VCS_GIT, statuses)
+
+        loaded = self.store.load(self.root, rabbitvcs.vcs.VCS_GIT)
+        self.assertEqual([(st.path, st.content) for st in loaded],
+                         [(self.root, "normal"),
+                          (join(self.root, "a"), "modified")])
+
+    def test_load_unknown(self):
+        self.assertEqual(self.store.load(self.root, rabbitvcs.vcs.VCS_GIT),
+                         None)
+
+    def test_load_out_of_date(self):
+        self.store.save(self.root, rabbitvcs.vcs.VCS_GIT,
+                        [make_status(self.root, "normal")])
+        self.touch_index()
+
+        self.assertEqual(self.store.load(self.root, rabbitvcs.vcs.VCS_GIT),
+                         None)
+
+        # Out of date statuses are dropped for good
+        self.touch_index()
+        self.assertEqual(self.store.load(self.root, rabbitvcs.vcs.VCS_GIT),
+                         None)
+
+    def test_load_other_vcs(self):
+        self.store.save(self.root, rabbitvcs.vcs.VCS_GIT,
+                        [make_status(self.root, "normal")])
+        self.assertEqual(self.store.load(self.root,
+                                         rabbitvcs.vcs.VCS_MERCURIAL),
+                         None)
+
+    def test_remove(self):
+        self.store.save(self.root, rabbitvcs.vcs.VCS_GIT,
+                        [make_status(self.root, "normal")])
+        self.store.remove(self.root)
+        self.assertEqual(self.store.load(self.root, rabbitvcs.vcs.VCS_GIT),
+                         None)
+
+
+class StatusWorkerStoreTest(StatusStoreTestCase):
+    """
+    The worker answers from the stored statuses until it has refreshed them.
+    The worker thread is not started, the tasks are run directly.
+
+    """
+    def setUp(self):
+        StatusStoreTestCase.setUp(self)
+        self.worker = StatusWorker("StatusWorker-test")
+
+        # Stored statuses that are out of date: "a" has since been reverted
+        # and "gone" removed, and "b" is not known yet
+        self.gone = join(self.root, "gone")
+        self.store.save(self.root, rabbitvcs.vcs.VCS_GIT, [
+            make_status(self.root, "modified"),
+            make_status(join(self.root, "a"), "modified"),
+            make_status(self.gone, "modified")
+        ])
+        write(join(self.root, "b"), "b\n")
+
+    def test_load(self):
+        self.worker.load_statuses(self.root, rabbitvcs.vcs.VCS_GIT,
+                                  self.store)
+        cache = self.worker.vcs_client.client(self.root).cache
+
+        self.assertTrue(cache.is_scanned(self.root, True))
+        self.assertEqual(cache[join(self.root, "a")].content,
+                         status_modified)
+        self.assertTrue(self.gone in cache)
+
+    def test_refresh(self):
+        self.worker.load_statuses(self.root, rabbitvcs.vcs.VCS_GIT,
+                                  self.store)
+        self.worker.refresh_statuses(self.root)
+        cache = self.worker.vcs_client.client(self.root).cache
+
+        self.assertTrue(cache.is_scanned(self.root, True))
+        self.assertEqual(cache[join(self.root, "a")].content, status_normal)
+        self.assertEqual(cache[join(self.root, "b")].content,
+                         status_unversioned)
+        self.assertFalse(self.gone in cache)
+
+    def test_save(self):
+        self.worker.roots[self.root] = rabbitvcs.vcs.VCS_GIT
+        self.worker.vcs_client.statuses(self.root)
+        self.worker.save_statuses(self.store)
+
+        loaded = self.store.load(self.root, rabbitvcs.vcs.VCS_GIT)
+        self.assertEqual(sorted([st.path for st in loaded]),
+                         [self.root, join(self.root, "a"),
+                          join(self.root, "b")])
+
+
+if __name__ == "__main__":
+    main()
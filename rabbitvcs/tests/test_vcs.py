@@ -0,0 +1,109 @@
+#
+# This is an extension to the Nautilus file manager to allow better
+# integration with the Subversion source control system.
+#
+# Copyright (C) 2006-2008 by Jason Field <jason@jasonfield.com>
+# Copyright (C) 2007-2008 by Bruce van der Kooij <brucevdkooij@gmail.com>
+# Copyright (C) 2008-2010 by Adam Plumb <adamplumb@gmail.com>
+#
+# RabbitVCS is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# RabbitVCS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RabbitVCS;  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Unit tests for the rabbitvcs.vcs package.
+
+"""
+
+# make sure the current working copy is in sys.path before anything else
+from os.path import abspath, dirname, join, normpath
+import sys
+toplevel = normpath(join(dirname(abspath(__file__)), '..', '..'))
+sys.path.insert(0, toplevel)
+
+from unittest import TestCase, main
+
+from rabbitvcs.vcs import ClientPool
+from rabbitvcs.vcs.status import StatusCache, Status, status_modified
+
+
+class FakeClient(object):
+    """
+    Stands in for a VCS client (eg. Git), counting how many are created.
+
+    """
+    instance_count = 0
+
+    def __init__(self):
+        FakeClient.instance_count += 1
+        self.repo_path = None
+        self.cache = StatusCache()
+
+    def set_repository(self, path):
+        self.repo_path = path
+
+
+class ClientPoolTest(TestCase):
+
+    def setUp(self):
+        FakeClient.instance_count = 0
+        self.pool = ClientPool(FakeClient, max_size=2)
+
+    def test_reuse(self):
+        client = self.pool.get("/wc/a")
+        self.assertEqual(client.repo_path, "/wc/a")
+        self.assertTrue(self.pool.get("/wc/a") is client)
+        self.assertEqual(FakeClient.instance_count, 1)
+
+    def test_evict_least_recently_used(self):
+        a = self.pool.get("/wc/a")
+        b = self.pool.get("/wc/b")
+
+        # Using a again makes b the least recently used
+        self.pool.get("/wc/a")
+        self.pool.get("/wc/c")
+
+        self.assertEqual(len(self.pool.values()), 2)
+        self.assertTrue(self.pool.get("/wc/a") is a)
+        self.assertEqual(FakeClient.instance_count, 3)
+
+        self.assertFalse(self.pool.get("/wc/b") is b)
+        self.assertEqual(FakeClient.instance_count, 4)
+
+    def test_default(self):
+        default = self.pool.default()
+        self.assertTrue(self.pool.get(None) is default)
+        self.assertFalse(default in self.pool.values())
+
+        # The default client does not count towards the pooled clients
+        self.pool.get("/wc/a")
+        self.pool.get("/wc/b")
+        self.assertEqual(len(self.pool.values()), 2)
+        self.assertTrue(self.pool.default() is default)
+
+    def test_shared_cache(self):
+        a = self.pool.get("/wc/a")
+        a.cache["/wc/a/file"] = Status("/wc/a/file", status_modified)
+        self.pool.get("/wc/b")
+        self.pool.get("/wc/c")
+
+        # The statuses outlive the evicted client
+        c = self.pool.get("/wc/a")
+        self.assertFalse(c is a)
+        self.assertTrue(c.cache is a.cache)
+        self.assertTrue("/wc/a/file" in c.cache)
+        self.assertTrue(self.pool.default().cache is a.cache)
+
+
+if __name__ == "__main__":
+    main()
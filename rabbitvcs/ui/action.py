@@ -346,6 +346,14 @@ class VCSAction(threading.Thread):
 
         return self.cancel
 
+    def get_cancel(self):
+        """
+        Used as a callback function by clients that poll for cancellation
+        (eg. gittyup).  Returns True once the user has cancelled the action.
+
+        """
+        return self.cancel
+
     def set_cancel(self, cancel=True):
         """
         Used as a callback function by the Notification UI.  When the cancel
@@ -737,7 +745,7 @@ class GitAction(VCSAction):
         self.client.set_callback_notify(self.notify)
         self.client.set_callback_progress_update(self.set_progress_fraction)
         self.client.set_callback_get_user(self.get_user)
-        self.client.set_callback_get_cancel(self.cancel)
+        self.client.set_callback_get_cancel(self.get_cancel)
 
     def notify(self, data):
         if self.has_notifier:
@@ -23,6 +23,7 @@
 from __future__ import division
 import threading
 from datetime import datetime
+from itertools import islice
 
 import os.path
 import pygtk
@@ -667,6 +668,12 @@ class GitLog(Log):
             }
         )
         self.start_point = 0
+
+        # The commits read so far, and the generator they are read from (see
+        # read_log_page)
+        self.log_items = []
+        self.log_generator = None
+
         self.initialize_root_url()
         self.load_or_refresh()
 
@@ -724,7 +731,10 @@ class GitLog(Log):
             msg = cgi.escape(rabbitvcs.util.helper.format_long_text(item.message, 80))
             author = item.author
             date = rabbitvcs.util.helper.format_datetime(item.date)
-            
+
+            if item.refs:
+                msg = "<i>[%s]</i> %s" % (cgi.escape(", ".join(item.refs)), msg)
+
             if item.head:
                 self.head_row = index
                 msg = "<b>%s</b>" % msg
@@ -758,15 +768,32 @@ class GitLog(Log):
             run_in_thread=True
         )        
 
-        self.action.append(
-            self.git.log,
-            path=self.path,
-            skip=self.start_point,
-            limit=self.limit+1
-        )
+        self.action.append(self.read_log_page)
         self.action.append(self.refresh)
         self.action.start()
 
+    def read_log_page(self):
+        """
+        Returns the commits for the current page (and the first commit of the
+        next page, if there is one).
+
+        The log is read lazily from a single log_iter generator, so that only
+        as many commits as the pages shown so far need are read, and going to
+        the next page carries on from where git stopped rather than running
+        it again.  Pages that have already been read are kept.
+
+        """
+
+        if self.log_generator is None:
+            self.log_generator = self.git.log_iter(path=self.path)
+
+        end = self.start_point + self.limit + 1
+        if len(self.log_items) < end:
+            self.log_items.extend(
+                islice(self.log_generator, end - len(self.log_items)))
+
+        return self.log_items[self.start_point:end]
+
     def copy_revision_text(self):
         text = ""
         for selected_row in self.revisions_table.get_selected_rows():
@@ -812,6 +839,12 @@ class GitLog(Log):
                 subitem[1]
             ])
 
+    def on_refresh_clicked(self, widget):
+        # The log may have changed, so read it again from the start
+        self.log_items = []
+        self.log_generator = None
+        Log.on_refresh_clicked(self, widget)
+
     def on_previous_clicked(self, widget):
         self.start_point -= self.limit
         if self.start_point < 0:
@@ -21,6 +21,9 @@
 #
 
 import os.path
+import threading
+from collections import OrderedDict
+
 from rabbitvcs import gettext
 _ = gettext.gettext
 
@@ -34,6 +37,9 @@ VCS_GIT = 'git'
 VCS_MERCURIAL = 'mercurial'
 VCS_DUMMY = 'unknown'
 
+# The most repositories to keep Git or Mercurial clients around for
+MAX_POOLED_CLIENTS = 8
+
 def guess(path):
     # Determine the VCS instance based on the path
     if path:
@@ -75,11 +81,95 @@ def guess(path):
         "repo_path": path
     }
 
+class ClientPool:
+    """
+    Keeps one client (eg. a Git instance) per repository, so that working in
+    several repositories side by side does not mean reopening them every time.
+    Once there are more than max_size of them, the least recently used clients
+    are dropped.
+
+    The clients share a single status cache, so that the statuses of a
+    repository outlive its client and the cache can choose which
+    repository's statuses to evict.
+    """
+
+    def __init__(self, client_class, max_size=MAX_POOLED_CLIENTS):
+        """
+        @param client_class: creates a client, and is given the repository
+                             root through the client's set_repository method
+        @type client_class: class
+        """
+        self.client_class = client_class
+        self.max_size = max_size
+        self.clients = OrderedDict()
+        self.default_client = None
+        self.cache = None
+        self.lock = threading.Lock()
+
+    def _share_cache(self, client):
+        # Must be called with the lock held
+        if self.cache is None:
+            self.cache = client.cache
+        else:
+            client.cache = self.cache
+
+    def default(self):
+        """
+        Returns a client that is not tied to any of the pooled repositories,
+        eg. for cloning or creating a repository.
+        """
+        self.lock.acquire()
+        try:
+            if self.default_client is None:
+                self.default_client = self.client_class()
+                self._share_cache(self.default_client)
+            return self.default_client
+        finally:
+            self.lock.release()
+
+    def get(self, repo_path):
+        """
+        Returns the client for the given repository root, creating it if need
+        be.
+        """
+        if repo_path is None:
+            return self.default()
+
+        self.lock.acquire()
+        try:
+            client = self.clients.pop(repo_path, None)
+            if client is None:
+                client = self.client_class()
+                client.set_repository(repo_path)
+                self._share_cache(client)
+
+            self.clients[repo_path] = client
+            while len(self.clients) > self.max_size:
+                self.clients.popitem(last=False)
+
+            return client
+        finally:
+            self.lock.release()
+
+    def values(self):
+        self.lock.acquire()
+        try:
+            return self.clients.values()
+        finally:
+            self.lock.release()
+
 class VCS:
     clients = {}
     
-    def __init__(self):
-        pass
+    def __init__(self, clients=None):
+        """
+        @param clients: if given, a dictionary to keep this instance's clients
+                        in, instead of sharing them with every other instance
+                        (eg. for use in another thread)
+        @type clients: dict
+        """
+        if clients is not None:
+            self.clients = clients
     
     def dummy(self):
         if VCS_DUMMY in self.clients:
@@ -104,68 +194,43 @@ class VCS:
                 return self.clients[VCS_SVN]
 
     def git(self, path=None, is_repo_path=False):
-        if VCS_GIT in self.clients:
-            git = self.clients[VCS_GIT]
-
-            if path:
-                if is_repo_path:
-                    git.set_repository(path)
-                else:
-                    repo_path = git.find_repository_path(path)
-                    git.set_repository(repo_path)
-
-            return git
-        else:
+        if VCS_GIT not in self.clients:
             try:
                 from rabbitvcs.vcs.git import Git
-                git = Git()
-
-                if path:
-                    if is_repo_path:
-                        git.set_repository(path)
-                    else:
-                        repo_path = git.find_repository_path(path)
-                        git.set_repository(repo_path)
-                
-                self.clients[VCS_GIT] = git
-                return self.clients[VCS_GIT]
+                self.clients[VCS_GIT] = ClientPool(Git)
             except Exception, e:
                 logger.debug("Unable to load Git module: %s" % e)
                 logger.exception(e)
                 self.clients[VCS_GIT] = self.dummy()
-                return self.clients[VCS_GIT]
 
-    def mercurial(self, path=None, is_repo_path=False):
-        if VCS_MERCURIAL in self.clients:
-            mercurial = self.clients[VCS_MERCURIAL]
-
-            if path:
-                if is_repo_path:
-                    mercurial.set_repository(path)
-                else:
-                    repo_path = mercurial.find_repository_path(path)
-                    mercurial.set_repository(repo_path)
+        return self._pooled_client(VCS_GIT, path, is_repo_path)
 
-            return mercurial
-        else:
+    def mercurial(self, path=None, is_repo_path=False):
+        if VCS_MERCURIAL not in self.clients:
             try:
                 from rabbitvcs.vcs.mercurial import Mercurial
-                mercurial = Mercurial()
-
-                if path:
-                    if is_repo_path:
-                        mercurial.set_repository(path)
-                    else:
-                        repo_path = mercurial.find_repository_path(path)
-                        mercurial.set_repository(repo_path)
-
-                self.clients[VCS_MERCURIAL] = mercurial
-                return self.clients[VCS_MERCURIAL]
+                self.clients[VCS_MERCURIAL] = ClientPool(Mercurial)
             except Exception, e:
                 logger.debug("Unable to load Mercurial module: %s" % e)
                 logger.exception(e)
                 self.clients[VCS_MERCURIAL] = self.dummy()
-                return self.clients[VCS_MERCURIAL]
+
+        return self._pooled_client(VCS_MERCURIAL, path, is_repo_path)
+
+    def _pooled_client(self, vcs, path, is_repo_path):
+        pool = self.clients[vcs]
+        if not isinstance(pool, ClientPool):
+            # The module could not be loaded
+            return pool
+
+        if not path:
+            return pool.default()
+
+        repo_path = path
+        if not is_repo_path:
+            repo_path = pool.default().find_repository_path(path)
+
+        return pool.get(repo_path)
 
     def client(self, path, vcs=None):
         # Determine the VCS instance based on the vcs parameter
@@ -221,6 +286,29 @@ class VCS:
         client = self.client(paths[0])
         return client.get_items(paths, statuses)
 
+    def invalidate(self, path):
+        """
+        Drops the cached statuses for the given path, everything below it and
+        the directories above it.
+        """
+        client = self.client(path)
+        if hasattr(client, "cache"):
+            client.cache.invalidate_path(path)
+            client.cache.invalidate_ancestors(path)
+
+    def status_caches(self):
+        """
+        Returns the status caches of every client that has been loaded.
+        """
+        caches = []
+        for client in self.clients.values():
+            if isinstance(client, ClientPool):
+                if client.cache is not None:
+                    caches.append(client.cache)
+            elif hasattr(client, "cache"):
+                caches.append(client.cache)
+        return caches
+
     def statuses_for_add(self,paths):
         client = self.client(paths[0])
         return client.STATUSES_FOR_ADD
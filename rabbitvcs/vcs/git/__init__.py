@@ -29,6 +29,7 @@ from datetime import datetime
 
 from gittyup.client import GittyupClient
 import gittyup.objects
+from gittyup.exceptions import GittyupCommandError
 
 import rabbitvcs.util.helper
 
@@ -138,7 +139,7 @@ class Git:
         else:
             self.client = GittyupClient()
 
-        self.cache = rabbitvcs.vcs.status.StatusCache()
+        self.cache = rabbitvcs.vcs.status.make_status_cache()
 
     def set_repository(self, path):
         self.client.set_repository(path)
@@ -154,23 +155,34 @@ class Git:
     # Status Methods
     #
     
-    def statuses(self, path, recurse=False, invalidate=False):
+    def statuses(self, path, recurse=True, invalidate=False):
         """
         Generates a list of GittyupStatus objects for the specified file.
         
         @type   path: string
         @param  path: The file to look up.  If the file is a directory, it will
             return a recursive list of child path statuses
+
+        @type   recurse: boolean
+        @param  recurse: If False, only look up the directory and its immediate
+            children (the statuses of subdirectories still summarise their
+            contents)
         
         """
 
         if path in self.cache:
             if invalidate:
                 del self.cache[path]
-            else:
+            elif self.cache.is_scanned(path, recurse):
                 return self.cache.find_path_statuses(path)
         
-        gittyup_statuses = self.client.status(path)
+        self.cache.mark_subtree(self.client.repo.path)
+
+        try:
+            gittyup_statuses = self.client.status(path, recurse=recurse)
+        except GittyupCommandError, e:
+            log.exception(e)
+            return [rabbitvcs.vcs.status.Status.status_error(path)]
 
         if not len(gittyup_statuses):
             return [rabbitvcs.vcs.status.Status.status_unknown(path)]
@@ -185,6 +197,8 @@ class Git:
                 self.cache[st.path] = rabbitvcs_status
                 
                 statuses.append(rabbitvcs_status)
+
+            self.cache.mark_scanned(path, recurse)
             return statuses
     
     def status(self, path, summarize=True, invalidate=False):
@@ -197,7 +211,10 @@ class Git:
                     st.summary = st.single
                 return st
         
-        all_statuses = self.statuses(path, invalidate=invalidate)
+        # The status of a directory already summarises its contents, so there
+        # is no need to look any deeper than its immediate children
+        all_statuses = self.statuses(path, recurse=False,
+                                     invalidate=invalidate)
         
         if summarize:
             path_status = None
@@ -735,64 +752,56 @@ class Git:
         
         """
         
-        # The strptime method relies on locales to work, and may not work with non en_US locales
-        # Temporarily change the locale to en_US so strptime can work consistently
-        # Then change it back at the end of the method
-        import locale
-        current_locale = locale.getlocale()
-        if current_locale[0] is not None:
-            locale.setlocale(locale.LC_ALL, "C")
+        return list(self.log_iter(path, skip, limit, revision, showtype))
 
-        items = self.client.log(path, skip, limit, revision.primitive(), showtype)
-        returner = []
-        for item in items:
-            revision = self.revision(item["commit"])
-            date = datetime.strptime(item["commit_date"][0:-6], "%a %b %d %H:%M:%S %Y")
-            
-            author = _("(no author)")
-            if "committer" in item:
-                author = item["committer"]
-                pos = author.find("<")
-                if pos != -1:
-                    author = author[0:pos-1]
-
-            message = ""
-            if "message" in item:
-                message = item["message"]
+    def log_iter(self, path=None, skip=0, limit=None, revision=Revision("HEAD"), showtype="all"):
+        """
+        Yields the commits of a revision history as rabbitvcs.vcs.log.Log
+        objects, as soon as git has written each of them out.  See log for
+        the parameters.
+        
+        """
+        
+        # Commits are usually followed by their first parent, so share the
+        # revision objects between them
+        revisions = {}
+        def get_revision(sha):
+            if sha not in revisions:
+                revisions[sha] = self.revision(sha)
+            return revisions[sha]
+
+        for item in self.client.log_iter(path, skip, limit, revision.primitive(), showtype):
+            date = datetime.fromtimestamp(item["commit_time"])
             
+            author = item["committer"]
+            pos = author.find("<")
+            if pos != -1:
+                author = author[0:pos-1]
+            if not author:
+                author = _("(no author)")
+
             changed_paths = []
-            if "changed_paths" in item:
-                for changed_path in item["changed_paths"]:
-                    action = "+%s/-%s" % (changed_path["additions"], changed_path["removals"])
-                
-                    changed_paths.append(rabbitvcs.vcs.log.LogChangedPath(
-                        changed_path["path"],
-                        action,
-                        "", ""
-                    ))
+            for changed_path in item["changed_paths"]:
+                action = "+%s/-%s" % (changed_path["additions"], changed_path["removals"])
             
-            parents = []
-            if "parents" in item:
-                for parent in item["parents"]:
-                    parents.append(self.revision(parent))
+                changed_paths.append(rabbitvcs.vcs.log.LogChangedPath(
+                    changed_path["path"],
+                    action,
+                    changed_path.get("old_path", ""), ""
+                ))
             
-            head = False
-            if item["commit"] == self.client.head():
-                head = True
+            parents = [get_revision(parent) for parent in item["parents"]]
             
-            returner.append(rabbitvcs.vcs.log.Log(
+            yield rabbitvcs.vcs.log.Log(
                 date,
-                revision,
+                revisions.pop(item["commit"], None) or self.revision(item["commit"]),
                 author,
-                message,
+                item["message"],
                 changed_paths,
                 parents,
-                head
-            ))
-            
-        locale.setlocale(locale.LC_ALL, current_locale)
-            
-        return returner
+                item["head"],
+                item["refs"]
+            )
 
     def diff_summarize(self, path1, revision_obj1, path2=None, revision_obj2=None):
         """
@@ -0,0 +1,78 @@
+#
+# capabilities.py
+#
+
+"""
+Works out what the installed git can do. git is only asked for its version
+once per process, however many clients there are, and the features gittyup
+cares about are derived from that version.
+"""
+
+import re
+import subprocess
+import threading
+
+# Features, along with the first git version that has them
+STATUS_IGNORED = "status-ignored"
+IGNORED_MATCHING = "ignored-matching"
+LOG_DECORATIONS = "log-decorations"
+
+FEATURES = {
+    # git status --porcelain -z --ignored, with -u and --ignored working
+    # together consistently
+    STATUS_IGNORED: (1, 8, 2),
+    # git status --ignored=matching
+    IGNORED_MATCHING: (2, 16, 0),
+    # %D in git log --pretty=format
+    LOG_DECORATIONS: (2, 3, 0)
+}
+
+_lock = threading.Lock()
+_probed = False
+_version = None
+
+def parse_version(output):
+    """
+    Returns the version in the output of "git --version" (eg. "git version
+    2.39.5", "git version 2.39.3 (Apple Git-146)") as a tuple of three ints,
+    or None if there is no version in it.
+    """
+    match = re.search(r"(\d+)\.(\d+)(?:\.(\d+))?", output)
+    if not match:
+        return None
+
+    return tuple([int(part or 0) for part in match.groups()])
+
+def get_version():
+    """
+    Returns the version of the installed git as a tuple of three ints, or
+    None if git could not be run.
+    """
+    global _probed, _version
+
+    _lock.acquire()
+    try:
+        if not _probed:
+            try:
+                proc = subprocess.Popen(["git", "--version"],
+                                        stdout=subprocess.PIPE,
+                                        close_fds=True)
+                _version = parse_version(proc.communicate()[0])
+            except OSError:
+                _version = None
+            _probed = True
+
+        return _version
+    finally:
+        _lock.release()
+
+def has_feature(feature):
+    """
+    Whether the installed git supports the given feature (one of the keys of
+    FEATURES).
+    """
+    version = get_version()
+    if version is None:
+        return False
+
+    return version >= FEATURES[feature]
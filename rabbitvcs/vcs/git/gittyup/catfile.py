@@ -0,0 +1,215 @@
+#
+# catfile.py
+#
+
+"""
+A pool of long-lived "git cat-file" processes, so that reading objects from a
+repository (eg. a file at a given revision) does not cost a fork and exec of
+git every time.
+
+There is at most one "git cat-file --batch" process per repository. A process
+that dies or stops making sense is replaced on the next request, and processes
+that have not been used for IDLE_TIMEOUT seconds are shut down.
+"""
+
+import atexit
+import os
+import subprocess
+import threading
+import time
+
+# How long a helper process can go unused before it is shut down (in seconds)
+IDLE_TIMEOUT = 60
+
+class CatFileError(Exception):
+    """Indicates that a cat-file helper process did not answer properly."""
+
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+class CatFileProcess:
+    """
+    A single "git cat-file --batch" process for a repository. Requests are
+    answered one at a time.
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        self.devnull = open(os.devnull, "w")
+        self.proc = subprocess.Popen(["git", "cat-file", "--batch"],
+                                     cwd=repo_path,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=self.devnull,
+                                     close_fds=True,
+                                     preexec_fn=os.setsid)
+
+    def is_alive(self):
+        return self.proc.poll() is None
+
+    def request(self, name):
+        """
+        Looks up an object by name (eg. a sha, "HEAD", "HEAD:path/to/file").
+
+        Returns (sha, type, size, data), or None if there is no such object.
+        """
+        if "\n" in name:
+            return None
+
+        self.lock.acquire()
+        try:
+            self.last_used = time.time()
+
+            self.proc.stdin.write(name + "\n")
+            self.proc.stdin.flush()
+
+            header = self.proc.stdout.readline()
+            if not header.endswith("\n"):
+                raise CatFileError("git cat-file exited")
+
+            # The name is only echoed back when there is no such object, and
+            # may have spaces in it
+            header = header[:-1]
+            if header.endswith(" missing") or header.endswith(" ambiguous"):
+                return None
+
+            parts = header.rsplit(" ", 2)
+            if len(parts) != 3:
+                raise CatFileError("Unexpected header from git cat-file")
+
+            (sha, type, size) = parts
+            size = int(size)
+
+            data = self.proc.stdout.read(size)
+            if len(data) != size or self.proc.stdout.read(1) != "\n":
+                raise CatFileError("Short read from git cat-file")
+
+            return (sha, type, size, data)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait()
+        except (IOError, OSError):
+            pass
+        self.devnull.close()
+
+class CatFilePool:
+    """
+    Keeps the cat-file processes for every repository used by this process.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.processes = {}
+        self.timer = None
+
+    def _get_process(self, repo_path):
+        self.lock.acquire()
+        try:
+            process = self.processes.get(repo_path)
+            if process and not process.is_alive():
+                process = None
+
+            if process is None:
+                process = CatFileProcess(repo_path)
+                self.processes[repo_path] = process
+                self._schedule_reap()
+
+            return process
+        finally:
+            self.lock.release()
+
+    def _discard(self, process):
+        self.lock.acquire()
+        try:
+            if self.processes.get(process.repo_path) is process:
+                del self.processes[process.repo_path]
+        finally:
+            self.lock.release()
+
+        process.close()
+
+    def request(self, repo_path, name):
+        """
+        Looks up an object in the given repository, see
+        CatFileProcess.request. If the helper process turns out to be broken
+        it is replaced and the request is tried once more.
+        """
+        for attempt in range(2):
+            process = self._get_process(repo_path)
+            try:
+                return process.request(name)
+            except (IOError, OSError, ValueError, CatFileError), e:
+                self._discard(process)
+                if attempt:
+                    raise CatFileError(str(e))
+
+    def _schedule_reap(self):
+        # Must be called with the lock held
+        if self.timer is None and self.processes:
+            self.timer = threading.Timer(self.idle_timeout, self.reap)
+            self.timer.setDaemon(True)
+            self.timer.start()
+
+    def reap(self):
+        """
+        Shuts down the processes that have not been used for a while.
+        """
+        now = time.time()
+        idle = []
+
+        self.lock.acquire()
+        try:
+            self.timer = None
+            for key, process in self.processes.items():
+                if now - process.last_used >= self.idle_timeout:
+                    idle.append(process)
+                    del self.processes[key]
+            self._schedule_reap()
+        finally:
+            self.lock.release()
+
+        for process in idle:
+            process.close()
+
+    def close(self):
+        """
+        Shuts down every process.
+        """
+        self.lock.acquire()
+        try:
+            processes = self.processes.values()
+            self.processes = {}
+            timer = self.timer
+            self.timer = None
+        finally:
+            self.lock.release()
+
+        if timer:
+            # Wait for the timer thread, so that it is not still running
+            # when the interpreter shuts down
+            timer.cancel()
+            timer.join()
+
+        for process in processes:
+            process.close()
+
+_pool = CatFilePool()
+atexit.register(_pool.close)
+
+def cat_file(repo_path, name):
+    """
+    Returns the (type, data) of an object in the given repository, or None if
+    there is no such object.
+    """
+    result = _pool.request(repo_path, name)
+    if result is None:
+        return None
+
+    return (result[1], result[3])
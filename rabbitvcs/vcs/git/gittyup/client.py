@@ -12,24 +12,29 @@ from string import ascii_letters, digits
 from datetime import datetime
 from mimetypes import guess_type
 
-import subprocess
-
 import dulwich.errors
 import dulwich.repo
 import dulwich.objects
 from dulwich.pack import Pack
 from dulwich.index import commit_index, write_index_dict, SHA1Writer
+from dulwich.index import cleanup_mode
 #from dulwich.patch import write_tree_diff
 
 from exceptions import *
 import util
 from objects import *
 from config import GittyupLocalFallbackConfig
+from ignore import IgnoreMatcher
+import capabilities
+import catfile
 from command import GittyupCommand
 
 TZ = -1 * time.timezone
 ENCODING = "UTF-8"
 
+# The number of fields log_iter asks git log for
+LOG_FIELDS = 8
+
 def callback_notify_null(val):
     pass
 
@@ -59,12 +64,15 @@ class GittyupClient:
         self.callback_get_cancel = callback_get_cancel
 
         self.global_ignore_patterns = []
-        
-        self.git_version = None
 
         self.numberOfCommandStages = 0
         self.numberOfCommandStagesExecuted = 0
 
+        # Blob shas of tracked files that had to be hashed because their
+        # stat data did not match the index, by relative path, along with
+        # the stat data they were hashed with (see _get_working_sha)
+        self.working_shas = {}
+
         if path:
             try:
                 self.repo = dulwich.repo.Repo(path)
@@ -122,62 +130,6 @@ class GittyupClient:
                 tree_index[item[0]] = (item[1], item[2])
         return tree_index
 
-    def _get_git_version(self):
-        """
-        Gets the local git version
-        """
-        
-        if self.git_version:
-            return self.git_version
-        else:
-            try:
-                proc = subprocess.Popen(["git", "--version"], stdout=subprocess.PIPE)
-                response = proc.communicate()[0].split()
-                version = response[2].split(".")
-                self.git_version = version
-                return self.git_version
-            except Exception, e:
-                return None
-
-    def _version_greater_than(self, version1, version2):
-        len1 = len(version1)
-        len2 = len(version2)
-        
-        max = 5
-
-        # Pad the version lists so they are the same length
-        if max > len1:
-            version1 += [0] * (max-len1)
-        if max > len2:
-            version2 += [0] * (max-len2)
-
-        if version1[0] > version2[0]:
-            return True
-
-        if (version1[0] == version2[0]
-                and version1[1] > version2[1]):
-            return True
-
-        if (version1[0] == version2[0]
-                and version1[1] == version2[1]
-                and version1[2] > version2[2]):
-            return True
-
-        if (version1[0] == version2[0]
-                and version1[1] == version2[1]
-                and version1[2] == version2[2]
-                and version1[3] > version2[3]):
-            return True
-
-        if (version1[0] == version2[0]
-                and version1[1] == version2[1]
-                and version1[2] == version2[2]
-                and version1[3] == version2[3]
-                and version1[4] > version2[4]):
-            return True
-
-        return False
-
     def _get_global_ignore_patterns(self):
         """
         Get ignore patterns from $GIT_DIR/info/exclude then from
@@ -245,6 +197,13 @@ class GittyupClient:
         
         return patterns
 
+    def get_ignore_matcher(self):
+        """
+        Returns an IgnoreMatcher for this repository, which takes the
+        .gitignore files and the global ignore files into account.
+        """
+        return IgnoreMatcher(self.repo.path, self.get_global_ignore_files())
+
     def get_local_config_file(self):
         try:
             git_dir = os.environ["GIT_DIR"]
@@ -367,6 +326,7 @@ class GittyupClient:
     def set_repository(self, path):
         try:
             self.repo = dulwich.repo.Repo(path)
+            self.working_shas = {}
             self._load_config()
         except dulwich.errors.NotGitRepository:
             raise NotRepositoryError()
@@ -1142,126 +1102,155 @@ class GittyupClient:
         
         return tags
 
-    def status_porcelain(self, path):
-        if os.path.isdir(path):
-            (files, directories) = self._read_directory_tree(path)
+    def status_porcelain(self, path, recurse=True):
+        """
+        Gets the statuses of the given path and everything below it from a
+        single "git status" run, scoped to the path. The other tracked files
+        come from "git ls-files", scoped the same way, and directories are
+        worked out from the paths of the files in them.
+
+        Raises GittyupCommandError if git fails, rather than reporting the
+        files as unchanged.
+
+        If recurse is False, untracked directories are not looked into (see
+        status).
+
+        Needs git 1.8.2 or later. Before git 2.16, ignored files are listed
+        the traditional way, ie. every file in an ignored directory is listed
+        when recursing.
+
+        """
+        rel_path = self.get_relative_path(path)
+
+        def in_scope(name):
+            return (not rel_path or name == rel_path
+                    or name.startswith(rel_path + "/"))
+
+        if recurse:
+            untracked_mode = "-uall"
         else:
-            files = [self.get_relative_path(path)]
-            directories = []
+            untracked_mode = "-unormal"
 
-        files_hash = {}
-        for file in files:
-            files_hash[file] = True
+        if capabilities.has_feature(capabilities.IGNORED_MATCHING):
+            ignored_mode = "--ignored=matching"
+        else:
+            ignored_mode = "--ignored"
+
+        pathspec = rel_path or "."
 
-        cmd = ["git", "status", "--porcelain", path]
+        cmd = ["git", "--literal-pathspecs", "status", "--porcelain", "-z",
+               ignored_mode, untracked_mode, "--", pathspec]
         try:
-            (status, stdout, stderr) = GittyupCommand(cmd, cwd=self.repo.path, notify=self.notify).execute()
+            (status, stdout, stderr) = GittyupCommand(cmd, cwd=self.repo.path, notify=self.notify).execute_raw()
         except GittyupCommandError, e:
             self.callback_notify(e)
-        
+            raise
+
         statuses = []
+        reported = {}
         modified_files = []
-        for line in stdout:
-            components = re.match("^([\sA-Z\?]+)\s(.*?)$", line)
-            if components:
-                status = components.group(1)
-                strip_status = status.strip()
-                path = components.group(2)
-               
-                if status == " D":
-                    statuses.append(MissingStatus(path))
-                elif strip_status in ["M", "R", "U"]:
-                    statuses.append(ModifiedStatus(path))
-                elif strip_status in ["A", "C"]:
-                    statuses.append(AddedStatus(path))
-                elif strip_status == "D":
-                    statuses.append(RemovedStatus(path))
-                elif strip_status == "??":
-                    statuses.append(UntrackedStatus(path))
-                
-                modified_files.append(path)
-                try:
-                    del files_hash[path]
-                except Exception, e:
-                    pass
-
-        # Determine untracked directories
-        cmd = ["git", "clean", "-nd", self.repo.path]
-        try:
-            (status, stdout, stderr) = GittyupCommand(cmd, cwd=self.repo.path, notify=self.notify).execute()
-        except GittyupCommandError, e:
-            self.callback_notify(e)
+        untracked_files = []
+        ignored_files = []
+        ignored_directories = []
+
+        entries = stdout.split("\0")
+        entries.reverse()
+        while entries:
+            entry = entries.pop()
+            if len(entry) < 4:
+                continue
 
-        untracked_directories = []
-        for line in stdout:
-            components = re.match("^(Would remove)\s(.*?)$", line)
-            untracked_path = components.group(2)
-            if untracked_path[-1]=='/':
-                untracked_directories.append(untracked_path[:-1])
+            code = entry[:2]
+            name = entry[3:]
+
+            if code[0] in "RC":
+                # Renames and copies are followed by the original path
+                if entries:
+                    source = entries.pop()
+                    if code[0] == "R" and in_scope(source):
+                        statuses.append(RemovedStatus(source))
+                        reported[source] = True
+                        modified_files.append(source)
+
+            if code == "!!":
+                if name.endswith("/"):
+                    name = name[:-1]
+                    ignored_directories.append(name)
+                else:
+                    ignored_files.append(name)
+                statuses.append(IgnoredStatus(name))
+                self.ignored_paths.append(name)
+                reported[name] = True
+                continue
+
+            if code == "??":
+                if name.endswith("/"):
+                    # An untracked directory (or nested repository)
+                    name = name[:-1]
+                statuses.append(UntrackedStatus(name))
+                untracked_files.append(name)
+            elif "U" in code or code in ("DD", "AA"):
+                statuses.append(ModifiedStatus(name))
+            elif code[1] == "D" and code[0] != "D":
+                statuses.append(MissingStatus(name))
+            elif code[0] == "D":
+                statuses.append(RemovedStatus(name))
+            elif code[0] in "ARC":
+                statuses.append(AddedStatus(name))
+            else:
+                statuses.append(ModifiedStatus(name))
 
-        #Determine the ignored files and directories in Repo
-        cmd = ["git", "clean", "-ndX", self.repo.path]
+            reported[name] = True
+            modified_files.append(name)
+
+        # Everything else in the index is unchanged
+        cmd = ["git", "--literal-pathspecs", "ls-files", "-z", "--", pathspec]
         try:
-            (status, stdout, stderr) = GittyupCommand(cmd, cwd=self.repo.path, notify=self.notify).execute()
+            (status, stdout, stderr) = GittyupCommand(cmd, cwd=self.repo.path, notify=self.notify).execute_raw()
         except GittyupCommandError, e:
             self.callback_notify(e)
-        ignored_directories=[]
-        for line in stdout:
-            components = re.match("^(Would remove)\s(.*?)$", line)
-            ignored_path=components.group(2)
-            if ignored_path[-1]=='/':
-                ignored_directories.append(ignored_path[:-1])
-                next
-            statuses.append(IgnoredStatus(ignored_path))
-            self.ignored_paths.append(ignored_path)
-            try:
-                del files_hash[ignored_path]
-            except Exception, e:
-                pass
-        for file,data in files_hash.items():
-            ignore_file=False
-            untracked_file=False
-            for ignored_path in ignored_directories:
-                if ignored_path in file:
-                    ignore_file=True
-                    break
-            for untracked_path in untracked_directories:
-                if untracked_path in file:
-                    untracked_file=True
-                    break
-            if untracked_file==True:
-                statuses.append(UntrackedStatus(file))
-                if ignore_file==True:
-                    self.ignored_paths.append(file)
-            elif ignore_file==True:
-                statuses.append(IgnoredStatus(file))
-                self.ignored_paths.append(file)
-            else:
-                statuses.append(NormalStatus(file))
+            raise
 
-        # Determine status of folders based on child contents
-        for d in directories:
-            d_status = NormalStatus(d)
+        tracked_directories = set()
+        for name in stdout.split("\0"):
+            if not name or not in_scope(name):
+                continue
 
-            # Check if directory is untracked or a sub-directory of an untracked directory
-            for untracked_path in untracked_directories:
-                if untracked_path in d:
-                    d_status = UntrackedStatus(d)
-                    break
+            if name not in reported:
+                # Unmerged files are listed once per stage
+                statuses.append(NormalStatus(name))
+                reported[name] = True
 
-            # Check if directory includes modified files
-            for file in modified_files:
-                if file.startswith(d):
-                    d_status = ModifiedStatus(d)
-                    break
+            self._add_parent_directories(name, tracked_directories)
 
-            # Check if directory is ignored
-            for ignored_path in ignored_directories:
-                if ignored_path in d:
-                    d_status = IgnoredStatus(d)
-                    break
-            statuses.append(d_status)
+        # Work out the directories from the files in them, directories
+        # without any tracked files in them are untracked
+        directories = set(tracked_directories)
+        if os.path.isdir(path):
+            directories.add(rel_path)
 
+        for name in reported:
+            self._add_parent_directories(name, directories)
+
+        untracked_directories = set()
+        for name in untracked_files:
+            self._add_parent_directories(name, untracked_directories,
+                                         stop=tracked_directories)
+
+        # Directories with nothing but ignored files in them are ignored too
+        # (git only lists the directory itself with --ignored=matching)
+        ignored_parents = set()
+        for name in ignored_files:
+            self._add_parent_directories(name, ignored_parents,
+                                         stop=tracked_directories)
+        ignored_directories.extend(ignored_parents - untracked_directories)
+
+        directories = [d for d in directories
+                       if in_scope(d) and d not in reported]
+
+        statuses += self._get_directory_statuses(directories, modified_files,
+                                                 untracked_directories,
+                                                 ignored_directories)
 
         return statuses
 
@@ -1279,6 +1268,11 @@ class GittyupClient:
         for file in files:
             files_hash[file] = True
         
+        try:
+            index_mtime = int(os.stat(self.repo.index_path()).st_mtime)
+        except OSError:
+            index_mtime = None
+
         statuses = []
         # Calculate statuses for files in the current HEAD
         modified_files = []
@@ -1293,8 +1287,9 @@ class GittyupClient:
                 absolute_path = self.get_absolute_path(name)
                 if os.path.isfile(absolute_path):
                     # Cached, determine if modified or not
-                    blob = self._get_blob_from_file(absolute_path)
-                    if blob.id == tree[name][1]:
+                    sha = self._get_working_sha(name, absolute_path,
+                                                index[name], index_mtime)
+                    if sha == tree[name][1]:
                         statuses.append(NormalStatus(name))
                     else:
                         modified_files.append(name)
@@ -1312,6 +1307,7 @@ class GittyupClient:
                 pass
 
         # Calculate statuses for untracked files
+        ignore_matcher = self.get_ignore_matcher()
         for name,data in files_hash.items():
             try:
                 inTreeIndex = tree[name]
@@ -1328,31 +1324,141 @@ class GittyupClient:
                 statuses.append(AddedStatus(name))
                 continue
 
-            # Generate a list of appropriate ignore patterns
-            patterns = []
-            path_to_check = os.path.dirname(self.get_absolute_path(name))
-            while path_to_check != self.repo.path:
-                patterns += self.get_ignore_patterns_from_file(self.get_local_ignore_file(path_to_check))
-                path_to_check = os.path.split(path_to_check)[0]
-
-            patterns += self.get_ignore_patterns_from_file(self.get_local_ignore_file(self.repo.path))
-            patterns += self.global_ignore_patterns
-            
-            if not self._ignore_file(patterns, os.path.basename(name)):
+            if not ignore_matcher.is_ignored(name):
                 statuses.append(UntrackedStatus(name))
             else:
                 self.ignored_paths.append(name)
 
-        # Determine status of folders based on child contents
-        for d in directories:
-            d_status = NormalStatus(d)
-            
-            for file in modified_files:
-                if os.path.join(d, os.path.basename(file)) == file:
-                    d_status = ModifiedStatus(d)
-                    break
-            
-            statuses.append(d_status)
+        statuses += self._get_directory_statuses(directories, modified_files)
+
+        return statuses
+
+    def _get_working_sha(self, name, path, entry, index_mtime):
+        """
+        Works out the blob sha of a tracked file in the working tree.
+
+        If the file's stat data (ctime, mtime, device, inode, mode and size)
+        matches what the index recorded for it, it has not changed since it
+        was last hashed, so the sha in the index is used. Otherwise (or if
+        the file is racily clean, ie. it was modified in the same second as
+        the index was written, so the stat data can't be trusted) the file is
+        read and hashed.
+
+        The index itself is never written to, since git may be using it.
+        Instead the shas of files that had to be hashed are remembered along
+        with their stat data, so that they are not hashed again until they
+        change.
+
+        @type   name: string
+        @param  name: The file's path relative to the repository
+
+        @type   entry: tuple
+        @param  entry: The file's index entry (ctime, mtime, dev, ino, mode,
+            uid, gid, size, sha, flags)
+
+        @type   index_mtime: int
+        @param  index_mtime: When the index was last written
+
+        """
+        st = os.lstat(path)
+        index_sha = entry[8]
+
+        stat_matches = (self._index_seconds(entry[0]) == int(st.st_ctime)
+            and self._index_seconds(entry[1]) == int(st.st_mtime)
+            and entry[2] == st.st_dev
+            and entry[3] == st.st_ino
+            and entry[4] == cleanup_mode(st.st_mode)
+            and entry[7] == st.st_size)
+
+        racily_clean = (index_mtime is None
+            or int(st.st_mtime) >= index_mtime)
+
+        if stat_matches and not racily_clean:
+            self.working_shas.pop(name, None)
+            return index_sha
+
+        stat_key = (int(st.st_ctime), int(st.st_mtime), st.st_dev, st.st_ino,
+                    st.st_mode, st.st_size)
+        known = self.working_shas.get(name)
+        if known and known[0] == stat_key:
+            return known[1]
+
+        sha = self._get_blob_from_file(path).id
+
+        if int(st.st_mtime) < int(time.time()):
+            # Files modified this very second could still change without
+            # their stat data changing, so we leave those to be hashed again
+            self.working_shas[name] = (stat_key, sha)
+        else:
+            self.working_shas.pop(name, None)
+
+        return sha
+
+    def _index_seconds(self, value):
+        """
+        Index times are (seconds, nanoseconds) tuples in newer versions of
+        dulwich, and numbers in older ones.
+
+        """
+        if isinstance(value, tuple):
+            return int(value[0])
+        return int(value)
+
+    def _add_parent_directories(self, name, directories, stop=()):
+        """
+        Adds the directories above the given relative path, up to and
+        including the root of the repository (""), to a set of directories.
+
+        Stops at the first directory that is already in the set (since the
+        ones above it must be too) or in the stop set, so adding the parents
+        of many paths only visits each directory once.
+
+        """
+        while name:
+            name = os.path.dirname(name)
+            if name in directories or name in stop:
+                return
+            directories.add(name)
+
+    def _get_directory_statuses(self, directories, modified_files,
+            untracked_directories=(), ignored_directories=()):
+        """
+        Works out the statuses of directories from the files below them.
+
+        A directory is ignored if it is in (or below) an ignored directory,
+        untracked if it is an untracked directory, modified if any file below
+        it has changed, and normal otherwise.
+
+        @type   directories: list
+        @param  directories: The relative paths of the directories
+
+        @type   modified_files: list
+        @param  modified_files: The relative paths of every file that is not
+            normal or ignored
+
+        """
+        modified_directories = set()
+        for name in modified_files:
+            self._add_parent_directories(name, modified_directories)
+
+        ignored_directories = set(ignored_directories)
+
+        # Parents sort before their children, so whether a directory is in an
+        # ignored one is known by the time we get to its children
+        ignored = {}
+        statuses = []
+        for d in sorted(directories):
+            ignored[d] = (d in ignored_directories
+                          or ignored.get(os.path.dirname(d), False))
+
+            if ignored[d]:
+                statuses.append(IgnoredStatus(d))
+            elif d in untracked_directories:
+                statuses.append(UntrackedStatus(d))
+            elif d in modified_directories:
+                statuses.append(ModifiedStatus(d))
+            else:
+                statuses.append(NormalStatus(d))
 
         return statuses
 
@@ -1360,19 +1466,74 @@ class GittyupClient:
         return self.ignored_paths
 
 
-    def status(self, path):
+    def status(self, path, recurse=True):
+        """
+        Gets the statuses of the given path and, if it is a directory, of
+        everything below it.
+
+        If recurse is False, only the statuses of the directory itself and of
+        its immediate children are returned (the statuses of subdirectories
+        still take everything below them into account).
+
+        """
         # TODO - simply get this from the status implementation / avoid global state
         self.ignored_paths = []
-        version = self._get_git_version()
-        if version and self._version_greater_than(version, [1,7,-1]):
-            return self.status_porcelain(path)
+        if capabilities.has_feature(capabilities.STATUS_IGNORED):
+            statuses = self.status_porcelain(path, recurse)
         else:
-            return self.status_dulwich(path)
+            statuses = self.status_dulwich(path)
+
+        if not recurse and os.path.isdir(path):
+            rel_path = self.get_relative_path(path)
+            statuses = [st for st in statuses if st.path == rel_path
+                        or (st.path and os.path.dirname(st.path) == rel_path)]
+
+        return statuses
 
     def log(self, path="", skip=0, limit=None, revision="", showtype="all"):
+        """
+        Returns a list of commits, see log_iter.
+        
+        """
         
-        cmd = ["git", "--no-pager", "log", "--numstat", "--parents", "--pretty=fuller", 
-            "--date-order"]
+        return list(self.log_iter(path, skip, limit, revision, showtype))
+
+    def log_iter(self, path="", skip=0, limit=None, revision="", showtype="all"):
+        """
+        Yields the commits in the history of the repository (or of a path in
+        it), newest first, as soon as git has written them out.
+        
+        Each commit is a dict with the keys "commit", "parents", "author",
+        "author_time", "committer", "commit_time" (seconds since the epoch),
+        "message", "head" (whether HEAD points at the commit), "refs" (the
+        names of the branches and tags pointing at it) and "changed_paths" (a
+        list of dicts with the keys "additions", "removals", "path" and, for
+        renamed or copied files, "old_path").
+        
+        """
+        
+        # Every commit starts with \x01 and has LOG_FIELDS NUL-terminated
+        # fields, followed by its NUL-terminated --numstat entries
+        # Older versions of git can't give the decorations on their own, in
+        # which case the field is left empty and HEAD is looked up separately
+        decorations = ""
+        head_sha = None
+        if capabilities.has_feature(capabilities.LOG_DECORATIONS):
+            decorations = "%D"
+        else:
+            try:
+                (status, stdout, stderr) = GittyupCommand(
+                    ["git", "rev-parse", "--verify", "-q", "HEAD"],
+                    cwd=self.repo.path, notify=self.notify).execute()
+                if status == 0 and stdout:
+                    head_sha = stdout[0].strip()
+            except GittyupCommandError, e:
+                pass
+
+        cmd = ["git", "--no-pager", "log", "-z", "--numstat", "--date-order",
+            "--decorate=short",
+            "--pretty=format:%%x01%%H%%x00%%P%%x00%%an <%%ae>%%x00%%at%%x00"
+                "%%cn <%%ce>%%x00%%ct%%x00%s%%x00%%B%%x00" % decorations]
 
         if showtype == "all":
             cmd.append("--all")
@@ -1389,65 +1550,103 @@ class GittyupClient:
         if path:
             cmd += ["--", path]
 
-        try:
-            (status, stdout, stderr) = GittyupCommand(cmd, cwd=self.repo.path, notify=self.notify, cancel=self.get_cancel).execute()
-        except GittyupCommandError, e:
-            self.callback_notify(e)
-            return []
+        records = GittyupCommand(cmd, cwd=self.repo.path, notify=self.notify,
+            cancel=self.get_cancel).execute_stream("\0")
 
-        revisions = []
-        revision = {}
-        changed_file = {}
-        for line in stdout:
-            if line == "":
-                continue
-            
-            if line[0:6] == "commit":
-                if revision:
-                    if "changed_paths" not in revision:
-                        revision["changed_paths"] = {}
-                    revisions.append(revision)
-            
-                revision = {}
-                changed_file = {}
-                commit_line = line.split(" ")
-                revision["commit"] = commit_line[1]
-                revision["parents"] = []
-                for parent in commit_line[2:]:
-                    revision["parents"].append(parent)
-            elif line[0:7] == "Author:":
-                revision["author"] = line[7:].strip()
-            elif line[0:11] == "AuthorDate:":
-                revision["author_date"] = line[11:].strip()
-            elif line[0:7] == "Commit:":
-                revision["committer"] = line[7:].strip()
-            elif line[0:11] == "CommitDate:":
-                revision["commit_date"] = line[11:].strip()
-            elif line[0:4] == "    ":
-                message = line[4:]
-                if "message" not in revision:
-                    revision["message"] = ""
-                else:
-                    revision["message"] += "\n"
-                    
-                revision["message"] = revision["message"] + message
-            elif line[0].isdigit() or line[0] in "-":
-                file_line = line.split("\t")
-                if not changed_file:
-                    revision["changed_paths"] = []
+        revision = None
+        fields = []
+        old_path = None
+        try:
+            for record in records:
+                if record.startswith("\x01"):
+                    if revision:
+                        yield revision
+                    revision = None
+                    fields = [record[1:]]
+                    continue
+
+                if len(fields) < LOG_FIELDS:
+                    fields.append(record)
+                    if len(fields) == LOG_FIELDS:
+                        (head, refs) = self._parse_decorations(fields[6])
+                        if head_sha:
+                            head = (fields[0] == head_sha)
+                        revision = {
+                            "commit": fields[0],
+                            "parents": fields[1].split(),
+                            "author": fields[2],
+                            "author_time": int(fields[3]),
+                            "committer": fields[4],
+                            "commit_time": int(fields[5]),
+                            "head": head,
+                            "refs": refs,
+                            "message": fields[7].rstrip("\n"),
+                            "changed_paths": []
+                        }
+                    continue
+
+                if revision is None:
+                    continue
+
+                # The first --numstat entry comes after a newline
+                changed_paths = revision["changed_paths"]
+                if not changed_paths and record.startswith("\n"):
+                    record = record[1:]
+                if not record:
+                    continue
+
+                if old_path is not None:
+                    # Renames and copies are followed by the old and new paths
+                    if old_path == "":
+                        old_path = record
+                    else:
+                        changed_paths[-1]["old_path"] = old_path
+                        changed_paths[-1]["path"] = record
+                        old_path = None
+                    continue
 
+                file_line = record.split("\t", 2)
                 if len(file_line) == 3:
-                    changed_file = {
+                    changed_paths.append({
                         "additions": file_line[0],
                         "removals": file_line[1],
                         "path": file_line[2]
-                    }
-                    revision["changed_paths"].append(changed_file)
+                    })
+                    if file_line[2] == "":
+                        old_path = ""
+        except GittyupCommandError, e:
+            self.callback_notify(e)
+            return
 
         if revision:
-            revisions.append(revision)
+            yield revision
+
+    def _parse_decorations(self, decorations):
+        """
+        Parses the decorations git log gives a commit (eg. "HEAD -> master,
+        tag: v1.0, origin/master") into a tuple (head, refs), where head tells
+        whether HEAD points at the commit and refs is a list of the names of
+        the branches and tags that do.
+        
+        """
+        
+        head = False
+        refs = []
+        for decoration in decorations.split(", "):
+            if not decoration:
+                continue
+            
+            if decoration == "HEAD":
+                head = True
+            elif decoration.startswith("HEAD -> "):
+                head = True
+                refs.append(decoration[8:])
+            elif decoration.startswith("tag: "):
+                refs.append(decoration[5:])
+            else:
+                refs.append(decoration)
 
-        return revisions
+        return (head, refs)
         
     def annotate(self, path, revision_obj="HEAD"):
         """
@@ -1510,6 +1709,20 @@ class GittyupClient:
 
         relative_path = self.get_relative_path(path)
 
+        # Ask the long-lived cat-file helper first, this saves starting git
+        try:
+            result = catfile.cat_file(self.repo.path,
+                                      "%s:%s" % (revision_obj, relative_path))
+            if result and result[0] == "blob":
+                # Give back what "git show" below would: its output is read
+                # with universal newlines, and without the final newline
+                content = result[1].replace("\r\n", "\n").replace("\r", "\n")
+                if content.endswith("\n"):
+                    content = content[:-1]
+                return content
+        except Exception, e:
+            pass
+
         cmd = ["git", "show", "%s:%s" % (revision_obj, relative_path)]
         try:
             (status, stdout, stderr) = GittyupCommand(cmd, cwd=self.repo.path, notify=self.notify, cancel=self.get_cancel).execute()
@@ -1900,4 +2113,4 @@ class GittyupClient:
         self.notify_and_parse_progress (return_data)
     
     def get_cancel(self):
-        return self.callback_get_cancel
+        return self.callback_get_cancel()
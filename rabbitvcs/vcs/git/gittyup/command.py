@@ -6,6 +6,7 @@ import subprocess
 import fcntl
 import select
 import os
+import tempfile
 
 from exceptions import GittyupCommandError
 
@@ -64,3 +65,75 @@ class GittyupCommand:
                 proc.kill()
 
         return (0, stdout, None)
+
+    def execute_raw(self):
+        """
+        Runs the command and returns its exit status, its standard output as
+        a single string (without any newline translation, eg. for commands
+        that separate their output with NULs) and its error output.
+        """
+        proc = subprocess.Popen(self.command,
+                                cwd=self.cwd,
+                                stdin=None,
+                                stderr=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                close_fds=True,
+                                preexec_fn=os.setsid)
+
+        (stdout, stderr) = proc.communicate()
+        if proc.returncode != 0:
+            raise GittyupCommandError(stderr)
+
+        return (proc.returncode, stdout, stderr)
+
+    def execute_stream(self, separator="\n", chunk_size=65536):
+        """
+        Runs the command and yields its standard output one record at a time
+        (without the separator), as soon as each record has been written, so
+        that large outputs can be processed without holding all of it in
+        memory. Stopping the iteration early kills the command.
+
+        Raises GittyupCommandError, once all of the output has been read, if
+        the command failed. A cancelled command just stops yielding records.
+        """
+        stderr = tempfile.TemporaryFile()
+        proc = subprocess.Popen(self.command,
+                                cwd=self.cwd,
+                                stdin=None,
+                                stderr=stderr,
+                                stdout=subprocess.PIPE,
+                                close_fds=True,
+                                preexec_fn=os.setsid)
+
+        cancelled = False
+        try:
+            buffer = ""
+            while True:
+                if self.get_cancel():
+                    cancelled = True
+                    break
+
+                data = os.read(proc.stdout.fileno(), chunk_size)
+                if not data:
+                    break
+
+                records = (buffer + data).split(separator)
+                buffer = records.pop()
+                for record in records:
+                    yield record
+
+            if cancelled:
+                return
+
+            if buffer:
+                yield buffer
+
+            if proc.wait() != 0:
+                stderr.seek(0)
+                raise GittyupCommandError(stderr.read())
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            stderr.close()
@@ -0,0 +1,294 @@
+#
+# ignore.py
+#
+
+import os
+import os.path
+import re
+
+# Python's re module can't handle more groups than this in one expression
+MAX_RULES_PER_EXPRESSION = 90
+
+# Parsed ignore files, by path, along with the (mtime, size) they were parsed
+# at, shared by every matcher
+_ignore_files = {}
+
+def translate_glob(glob):
+    """
+    Translates one component of a gitignore pattern (ie. one without any
+    slashes in it) to a regular expression.
+
+    """
+    i = 0
+    n = len(glob)
+    res = []
+    while i < n:
+        c = glob[i]
+        i += 1
+        if c == "*":
+            res.append("[^/]*")
+        elif c == "?":
+            res.append("[^/]")
+        elif c == "\\" and i < n:
+            res.append(re.escape(glob[i]))
+            i += 1
+        elif c == "[":
+            j = i
+            if j < n and glob[j] in "!^":
+                j += 1
+            if j < n and glob[j] == "]":
+                j += 1
+            while j < n and glob[j] != "]":
+                j += 1
+            if j >= n:
+                res.append("\\[")
+            else:
+                stuff = glob[i:j].replace("\\", "\\\\")
+                i = j + 1
+                if stuff[0] in "!^":
+                    stuff = "^" + stuff[1:]
+                res.append("[%s]" % stuff)
+        else:
+            res.append(re.escape(c))
+
+    return "".join(res)
+
+def translate_pattern(pattern):
+    """
+    Translates a gitignore pattern to a regular expression matching paths
+    relative to the directory of the ignore file it came from.
+
+    Returns a tuple (expression, negated, directory_only), or None if the
+    line is blank or a comment.
+
+    """
+    pattern = pattern.rstrip("\n").rstrip("\r")
+    if not pattern or pattern.startswith("#"):
+        return None
+
+    # Trailing spaces are ignored unless they are escaped
+    stripped = pattern.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(pattern):
+        stripped += " "
+    pattern = stripped
+    if not pattern:
+        return None
+
+    negated = False
+    if pattern.startswith("!"):
+        negated = True
+        pattern = pattern[1:]
+    elif pattern.startswith("\\!") or pattern.startswith("\\#"):
+        pattern = pattern[1:]
+
+    directory_only = False
+    if pattern.endswith("/"):
+        directory_only = True
+        pattern = pattern.rstrip("/")
+
+    if not pattern:
+        return None
+
+    # Patterns with a slash in them (other than a trailing one) are relative
+    # to the ignore file's directory, others match at any depth
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    components = pattern.split("/")
+    parts = []
+    for index, component in enumerate(components):
+        last = (index == len(components) - 1)
+        if component == "**":
+            if last:
+                parts.append(".*")
+            else:
+                parts.append("(?:.*/)?")
+        else:
+            parts.append(translate_glob(component))
+            if not last:
+                parts.append("/")
+
+    expression = "".join(parts)
+    if not anchored:
+        expression = "(?:.*/)?" + expression
+
+    return (expression, negated, directory_only)
+
+class IgnoreRules:
+    """
+    The rules from a single ignore file, compiled into a few combined
+    regular expressions.
+
+    Within a file, the last rule that matches a path decides whether it is
+    ignored. The rules are combined in reverse order, so that the first
+    alternative to match is the last rule in the file.
+
+    """
+
+    def __init__(self, lines):
+        self.rules = []
+        for line in lines:
+            rule = translate_pattern(line)
+            if rule:
+                self.rules.append(rule)
+
+        self.file_expressions = self._compile(
+            [rule for rule in self.rules if not rule[2]])
+        self.directory_expressions = self._compile(self.rules)
+
+    def _compile(self, rules):
+        """
+        Returns a list of (expression, negations) for the given rules, last
+        rules first, where negations[i] tells whether the rule in group i + 1
+        of the expression is a negated one.
+
+        """
+        expressions = []
+        rules = list(reversed(rules))
+        for start in range(0, len(rules), MAX_RULES_PER_EXPRESSION):
+            chunk = rules[start:start + MAX_RULES_PER_EXPRESSION]
+            expression = re.compile("(?:%s)\\Z" % "|".join(
+                ["(%s)" % rule[0] for rule in chunk]))
+            expressions.append((expression, [rule[1] for rule in chunk]))
+        return expressions
+
+    def match(self, path, is_directory=False):
+        """
+        Returns True if the path (relative to the ignore file's directory) is
+        ignored by these rules, False if it is explicitly not ignored (by a
+        negated rule), or None if no rule matches it.
+
+        """
+        if is_directory:
+            expressions = self.directory_expressions
+        else:
+            expressions = self.file_expressions
+
+        for (expression, negations) in expressions:
+            match = expression.match(path)
+            if match:
+                return not negations[match.lastindex - 1]
+
+        return None
+
+def load_ignore_file(path):
+    """
+    Returns the IgnoreRules for the given ignore file, or None if there is no
+    such file. Files are only parsed again when they change.
+
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        _ignore_files.pop(path, None)
+        return None
+
+    stamp = (st.st_mtime, st.st_size)
+    cached = _ignore_files.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    try:
+        f = open(path, "r")
+        try:
+            rules = IgnoreRules(f.readlines())
+        finally:
+            f.close()
+    except IOError:
+        return None
+
+    _ignore_files[path] = (stamp, rules)
+    return rules
+
+class IgnoreMatcher:
+    """
+    Decides whether paths in a repository are ignored, following git's rules:
+
+        - the .gitignore files in a path's directory and in the directories
+          above it are checked first (deepest first), then the global ignore
+          files (eg. $GIT_DIR/info/exclude, core.excludesfile)
+        - the first of those with a rule matching the path decides
+        - a path inside an ignored directory is ignored, whatever the rules
+          say about the path itself
+
+    A matcher remembers the ignore files it has looked at and the directories
+    it has checked, so it should only be used for as long as the ignore files
+    are not expected to change (eg. a single status check).
+
+    """
+
+    def __init__(self, repo_path, global_files=[]):
+        """
+        @type   repo_path: string
+        @param  repo_path: The root of the working tree
+
+        @type   global_files: list
+        @param  global_files: Ignore files that apply to the whole repository,
+            most important first
+
+        """
+        self.repo_path = repo_path
+        self.global_rules = []
+        for path in global_files:
+            rules = load_ignore_file(os.path.expanduser(path))
+            if rules:
+                self.global_rules.append(rules)
+
+        self.local_rules = {}
+        self.ignored_directories = {}
+
+    def _get_local_rules(self, directory):
+        if directory not in self.local_rules:
+            self.local_rules[directory] = load_ignore_file(
+                os.path.join(self.repo_path, directory, ".gitignore"))
+        return self.local_rules[directory]
+
+    def _match(self, path, is_directory):
+        directory = path
+        while directory:
+            directory = os.path.dirname(directory)
+            rules = self._get_local_rules(directory)
+            if rules:
+                if directory:
+                    relative_path = path[len(directory) + 1:]
+                else:
+                    relative_path = path
+
+                result = rules.match(relative_path, is_directory)
+                if result is not None:
+                    return result
+
+        for rules in self.global_rules:
+            result = rules.match(path, is_directory)
+            if result is not None:
+                return result
+
+        return False
+
+    def is_directory_ignored(self, path):
+        """
+        Whether the given directory (relative to the root of the working tree)
+        is ignored, either itself or because it is inside an ignored directory.
+
+        """
+        if not path:
+            return False
+
+        if path not in self.ignored_directories:
+            self.ignored_directories[path] = (
+                self.is_directory_ignored(os.path.dirname(path))
+                or self._match(path, True))
+
+        return self.ignored_directories[path]
+
+    def is_ignored(self, path, is_directory=False):
+        """
+        Whether the given path (relative to the root of the working tree) is
+        ignored.
+
+        """
+        if is_directory:
+            return self.is_directory_ignored(path)
+
+        return (self.is_directory_ignored(os.path.dirname(path))
+                or self._match(path, False))
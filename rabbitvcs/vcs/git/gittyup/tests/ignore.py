@@ -0,0 +1,90 @@
+#
+# test/ignore.py
+#
+
+import os
+from shutil import rmtree
+from sys import argv
+from optparse import OptionParser
+
+from gittyup.client import GittyupClient
+from gittyup.ignore import IgnoreMatcher
+from util import touch
+
+parser = OptionParser()
+parser.add_option("-c", "--cleanup", action="store_true", default=False)
+(options, args) = parser.parse_args(argv)
+
+DIR = "ignore"
+
+def write(path, lines):
+    f = open(path, "w")
+    f.write("\n".join(lines) + "\n")
+    f.close()
+
+if options.cleanup:
+    rmtree(DIR, ignore_errors=True)
+
+    print "ignore.py clean"
+else:
+    if os.path.isdir(DIR):
+        raise SystemExit("This test script has already been run.  Please call this script with --cleanup to start again")
+
+    os.mkdir(DIR)
+    g = GittyupClient()
+    g.initialize_repository(DIR)
+
+    os.makedirs(DIR + "/src/lib")
+    os.makedirs(DIR + "/build")
+    os.makedirs(DIR + "/docs/api")
+    if not os.path.isdir(DIR + "/.git/info"):
+        os.makedirs(DIR + "/.git/info")
+    
+    write(DIR + "/.gitignore", [
+        "# comment",
+        "*.o",
+        "!keep.o",
+        "/build/",
+        "docs/**/*.html",
+        "tmp/",
+        "\\#notes"
+    ])
+    write(DIR + "/src/.gitignore", [
+        "!lib.o",
+        "generated"
+    ])
+    write(DIR + "/.git/info/exclude", [
+        "*.swp"
+    ])
+
+    m = IgnoreMatcher(os.path.abspath(DIR), [DIR + "/.git/info/exclude"])
+
+    assert m.is_ignored("main.o")
+    assert m.is_ignored("src/lib/util.o")
+    assert not m.is_ignored("keep.o")
+    assert not m.is_ignored("src/lib.o")
+    assert m.is_ignored("src/lib/generated")
+    assert not m.is_ignored("generated")
+    assert m.is_ignored("build", is_directory=True)
+    assert m.is_ignored("build/anything.c")
+    assert not m.is_ignored("src/build", is_directory=True)
+    assert m.is_ignored("docs/index.html")
+    assert m.is_ignored("docs/api/index.html")
+    assert not m.is_ignored("index.html")
+    assert m.is_ignored("src/tmp", is_directory=True)
+    assert not m.is_ignored("src/tmp")
+    assert m.is_ignored("src/tmp/file.c")
+    assert m.is_ignored("#notes")
+    assert m.is_ignored("src/main.c.swp")
+    assert not m.is_ignored("src/main.c")
+
+    # Changing an ignore file is picked up by new matchers
+    write(DIR + "/src/.gitignore", [
+        "*.c"
+    ])
+    os.utime(DIR + "/src/.gitignore", (0, 0))
+    m = IgnoreMatcher(os.path.abspath(DIR), [DIR + "/.git/info/exclude"])
+    assert m.is_ignored("src/main.c")
+    assert m.is_ignored("src/lib.o")
+
+    print "ignore.py pass"
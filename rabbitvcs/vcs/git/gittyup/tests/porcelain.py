@@ -0,0 +1,110 @@
+#
+# test/porcelain.py
+#
+
+import os
+import subprocess
+from shutil import rmtree
+from sys import argv
+from optparse import OptionParser
+
+from gittyup.client import GittyupClient
+from gittyup.exceptions import GittyupCommandError
+from gittyup.objects import *
+from util import touch, change
+
+parser = OptionParser()
+parser.add_option("-c", "--cleanup", action="store_true", default=False)
+(options, args) = parser.parse_args(argv)
+
+DIR = "porcelain"
+
+def write(path, lines):
+    f = open(path, "w")
+    f.write("\n".join(lines) + "\n")
+    f.close()
+
+def git(*args):
+    subprocess.check_call(["git", "-c", "user.name=Test",
+                           "-c", "user.email=test@example.com"] + list(args),
+                          cwd=DIR)
+
+def statuses(g, path, recurse=True):
+    found = {}
+    for st in g.status(path, recurse):
+        found[st.path] = st
+    return found
+
+if options.cleanup:
+    rmtree(DIR, ignore_errors=True)
+
+    print "porcelain.py clean"
+else:
+    if os.path.isdir(DIR):
+        raise SystemExit("This test script has already been run.  Please call this script with --cleanup to start again")
+
+    os.mkdir(DIR)
+    root = os.path.abspath(DIR)
+    git("init", "-q")
+    g = GittyupClient(root)
+
+    os.mkdir(DIR + "/src")
+    touch(DIR + "/old.txt")
+    touch(DIR + "/src/main.c")
+    write(DIR + "/.gitignore", ["build", "*.o"])
+    git("add", "old.txt", "src/main.c", ".gitignore")
+    git("commit", "-q", "-m", "Initial commit")
+
+    # A staged rename shows up as the removal of the old path and the
+    # addition of the new one
+    git("mv", "old.txt", "new.txt")
+    st = statuses(g, root)
+    assert (st["old.txt"] == RemovedStatus)
+    assert (st["new.txt"] == AddedStatus)
+    assert (st["src/main.c"] == NormalStatus)
+    assert (st["src"] == NormalStatus)
+
+    # The old path is left out when only the new one is in scope
+    touch(DIR + "/src/util.c")
+    git("add", "src/util.c")
+    git("commit", "-q", "-m", "Add util.c")
+    git("mv", "new.txt", "src/moved.txt")
+    st = statuses(g, root + "/src")
+    assert (st["src/moved.txt"] == AddedStatus)
+    assert ("new.txt" not in st)
+    git("commit", "-q", "-m", "Move new.txt")
+
+    # Ignored directories, and directories holding nothing but ignored
+    # files, are ignored; directories with untracked files are untracked
+    os.mkdir(DIR + "/build")
+    touch(DIR + "/build/out.bin")
+    os.mkdir(DIR + "/objects")
+    touch(DIR + "/objects/main.o")
+    os.mkdir(DIR + "/docs")
+    touch(DIR + "/docs/readme.txt")
+    touch(DIR + "/src/main.o")
+    change(DIR + "/src/main.c")
+    st = statuses(g, root)
+    assert (st["build"] == IgnoredStatus)
+    assert (st["objects"] == IgnoredStatus)
+    assert (st["src/main.o"] == IgnoredStatus)
+    assert (st["docs"] == UntrackedStatus)
+    assert (st["docs/readme.txt"] == UntrackedStatus)
+    assert (st["src/main.c"] == ModifiedStatus)
+    assert (st["src"] == ModifiedStatus)
+
+    # Without recursing, untracked directories are not looked into
+    st = statuses(g, root, False)
+    assert (st["docs"] == UntrackedStatus)
+    assert ("docs/readme.txt" not in st)
+
+    # A failing git is an error, not a clean working copy
+    write(DIR + "/.git/index", ["not an index"])
+    try:
+        g.status(root)
+    except GittyupCommandError:
+        pass
+    else:
+        raise AssertionError("status did not fail")
+
+    print "porcelain.py pass"
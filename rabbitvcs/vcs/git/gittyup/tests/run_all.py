@@ -18,7 +18,9 @@ modules = [
     "clone.py",
     "move.py",
     "pull.py",
-    "remote.py"
+    "remote.py",
+    "ignore.py",
+    "porcelain.py"
 ]
 
 if len(argv) == 2 and  argv[1] == "--cleanup":
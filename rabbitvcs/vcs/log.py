@@ -45,10 +45,13 @@ class Log:
     parents = []
     head = False
     
+    # The names of the branches and tags pointing at this revision
+    refs = []
+    
     # A list of LogChangedFiles elements
     changed_paths = []
     
-    def __init__(self, date, revision, author, message, changed_paths, parents=[], head=False):
+    def __init__(self, date, revision, author, message, changed_paths, parents=[], head=False, refs=[]):
         self.date = date
         self.revision = revision
         self.author = author
@@ -56,6 +59,7 @@ class Log:
         self.changed_paths = changed_paths
         self.parents = parents
         self.head = head
+        self.refs = refs
         
     def get_date(self):
         return self.date
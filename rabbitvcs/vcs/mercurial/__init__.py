@@ -25,9 +25,13 @@ Concrete VCS implementation for Mercurial functionality.
 """
 
 import os.path
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
 from datetime import datetime
+from itertools import islice
 
-from mercurial import commands, ui, hg
+from mercurial import commands, ui, hg, scmutil, patch
 
 import rabbitvcs.util.helper
 
@@ -43,6 +47,81 @@ log = Log("rabbitvcs.vcs.mercurial")
 from rabbitvcs import gettext
 _ = gettext.gettext
 
+# Repository objects, by root, shared by every client in the same thread
+# (the objects are not thread safe), least recently used first. Each is kept
+# with the stamps of its store files (changelog, bookmarks and phases) and of
+# its dirstate file as of when it was last refreshed.
+_local = threading.local()
+
+# The files whose changes mean the repository's cached state (as opposed to
+# its dirstate) must be read again, and whether each is in the store
+STORE_FILES = [
+    ("00changelog.i", True),
+    ("phaseroots", True),
+    ("bookmarks", False)
+]
+
+def _get_file_stamp(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime, st.st_size)
+    except OSError:
+        return None
+
+def _get_store_stamp(repository):
+    stamp = []
+    for name, in_store in STORE_FILES:
+        if in_store:
+            stamp.append(_get_file_stamp(repository.svfs.join(name)))
+        else:
+            stamp.append(_get_file_stamp(repository.vfs.join(name)))
+    return tuple(stamp)
+
+def get_repository(repository_ui, path):
+    """
+    Returns a repository object for the given root, reusing the one from a
+    previous call in the same thread if there is one, so that hgrc, the
+    requirements and the changelog index are not read again every time.
+    
+    If the changelog, the bookmarks, the phases or the dirstate have changed
+    on disk since the object was last handed out, its cached copies of them
+    are dropped (using the repository's own invalidate methods) and read
+    again when needed.
+    
+    Repository objects are not thread safe, so every thread gets its own.
+    Once a thread has more than rabbitvcs.vcs.MAX_POOLED_CLIENTS of them, the
+    least recently used ones are dropped, as are the objects of a thread when
+    it exits.
+    
+    """
+
+    repositories = getattr(_local, "repositories", None)
+    if repositories is None:
+        repositories = _local.repositories = OrderedDict()
+
+    entry = repositories.pop(path, None)
+    if entry is None:
+        repository = hg.repository(repository_ui, path)
+        entry = [repository, None, None]
+    else:
+        repository = entry[0]
+
+    repositories[path] = entry
+    while len(repositories) > rabbitvcs.vcs.MAX_POOLED_CLIENTS:
+        repositories.popitem(last=False)
+
+    store_stamp = _get_store_stamp(repository)
+    dirstate_stamp = _get_file_stamp(repository.vfs.join("dirstate"))
+
+    if entry[1] is not None and entry[1] != store_stamp:
+        repository.invalidate()
+    if entry[2] is not None and entry[2] != dirstate_stamp:
+        repository.invalidatedirstate()
+
+    entry[1] = store_stamp
+    entry[2] = dirstate_stamp
+    return repository
+
 class Revision:
     """
     Implements a simple revision object as a wrapper around the gittyup revision
@@ -126,15 +205,31 @@ class Mercurial:
 
         self.ui = ui.ui()
         self.repository = None
+
+        # Rather than have Mercurial list every clean file, infer them from
+        # the files in the dirstate (see _get_tracked_files)
+        self.fast_status = True
+        self.dirstate_snapshot = None
+
         if repo:
-            self.repository_path = repo
-            self.repository = hg.repository(self.ui, self.repository_path)
+            self.set_repository(repo)
 
-        self.cache = rabbitvcs.vcs.status.StatusCache()
+        self.cache = rabbitvcs.vcs.status.make_status_cache()
 
     def set_repository(self, path):
         self.repository_path = path
-        self.repository = hg.repository(self.ui, self.repository_path)
+        self.repository = get_repository(self.ui, self.repository_path)
+        self.dirstate_snapshot = None
+
+    def refresh_repository(self):
+        """
+        Makes sure the repository object has not missed any changes made on
+        disk (eg. by a commit on the command line), and that it belongs to
+        the calling thread.
+        
+        """
+
+        self.repository = get_repository(self.ui, self.repository_path)
 
     def get_repository(self):
         return self.repository_path
@@ -158,55 +253,253 @@ class Mercurial:
     def get_absolute_path(self, path):
         return os.path.join(self.repository_path, path).rstrip("/")
     
+    def revision(self, value):
+        """
+        Create a revision object
+
+        @type   value: string
+        @param  value: HEAD, WORKING or a changeset hash
+
+        @rtype:         Revision object
+        @return:        A Revision object.
+
+        """
+        if value is None:
+            return Revision("WORKING")
+        
+        value_upper = value.upper()
+        if value_upper == "HEAD" or value_upper == "BASE":
+            return Revision("HEAD")
+        elif value_upper == "WORKING":
+            return Revision("WORKING")
+        else:
+            return Revision("hash", value)
+
+    def _get_changectx(self, revision_obj):
+        """
+        Returns the Mercurial changeset for a revision object (the working
+        directory for WORKING or None, its first parent for HEAD).
+        
+        """
+        if revision_obj is None or revision_obj.kind == "WORKING":
+            return self.repository[None]
+        elif revision_obj.kind == "HEAD":
+            return self.repository["."]
+        else:
+            return self.repository[revision_obj.primitive()]
+
+    def _get_match(self, ctx, paths):
+        """
+        Returns a matcher for the given absolute paths (and everything below
+        them), or for the whole repository if there are none.
+        
+        """
+        patterns = []
+        for path in paths:
+            relative_path = self.get_relative_path(path)
+            if relative_path:
+                patterns.append("path:" + relative_path)
+
+        if not patterns:
+            return scmutil.matchall(self.repository)
+
+        return scmutil.match(ctx, patterns, badfn=lambda f, msg: None)
+
     def statuses(self, path, recurse=True, invalidate=False):
-        mercurial_statuses = self.repository.status(clean=True, unknown=True)
+        """
+        Generates a list of MercurialStatus objects for the specified path.
+        
+        @type   path: string
+        @param  path: The path to look up.  If it is a directory, the statuses
+            of everything below it are returned too, the directory itself first
+
+        @type   recurse: boolean
+        @param  recurse: If False, only return the statuses of the directory
+            and of its immediate children (the statuses of subdirectories
+            still summarise their contents)
+        
+        """
+
+        if path in self.cache:
+            if invalidate:
+                del self.cache[path]
+            elif self.cache.is_scanned(path, recurse):
+                return self.cache.find_path_statuses(path)
+
+        self.cache.mark_subtree(self.repository_path)
+        self.refresh_repository()
+
+        relative_path = self.get_relative_path(path)
+        match = self._get_match(self.repository[None], [path])
 
-        # the status method returns a series of tuples filled with files matching
-        # the statuses below
-        tuple_order = ["modified", "added", "removed", "missing", "unknown", "ignored", "clean"]
+        if self.fast_status:
+            tracked_files = self._get_tracked_files()
+
+        mercurial_statuses = self.repository.status(match=match,
+            ignored=True, clean=not self.fast_status, unknown=True)
+
+        if self.fast_status:
+            clean_files = self._get_clean_files(tracked_files, relative_path,
+                mercurial_statuses)
+        else:
+            clean_files = mercurial_statuses.clean
+
+        # The files in each of Mercurial's status lists, with the content
+        # status to give them
+        status_lists = [
+            ("modified", mercurial_statuses.modified),
+            ("added", mercurial_statuses.added),
+            ("removed", mercurial_statuses.removed),
+            ("missing", mercurial_statuses.deleted),
+            ("unknown", mercurial_statuses.unknown),
+            ("ignored", mercurial_statuses.ignored),
+            ("clean", clean_files)
+        ]
         
-        # go through each tuple (each of which has a defined status), and
-        # generate a flat list of rabbitvcs statuses
-        statuses = []
-        index = 0
-        directories = {}
-        for status_tuple in mercurial_statuses:
-            content = tuple_order[index]
-            for item in status_tuple:
-                st_path = self.get_absolute_path(item)
-                
-                rabbitvcs_status = rabbitvcs.vcs.status.MercurialStatus({
-                    "path": st_path,
+        # go through each list, and generate a flat list of rabbitvcs
+        # statuses, noting which directories have tracked, changed and
+        # unknown files below them on the way
+        file_statuses = []
+        directories = set()
+        tracked_directories = set()
+        changed_directories = set()
+        unknown_directories = set()
+        for content, names in status_lists:
+            for item in names:
+                file_statuses.append(rabbitvcs.vcs.status.MercurialStatus({
+                    "path": self.get_absolute_path(item),
                     "content": content
-                })
-                statuses.append(rabbitvcs_status)
-                
-                # determine the statuses of the parent folders
-                dir_content = content
-                if content in self.STATUSES_FOR_REVERT:
-                    dir_content = "modified"
-                
-                path_to_check = os.path.dirname(st_path)
-                while True:
-                    if path_to_check not in directories or directories[path_to_check] not in self.STATUSES_FOR_COMMIT:
-                        rabbitvcs_status = rabbitvcs.vcs.status.MercurialStatus({
-                            "path": path_to_check,
-                            "content": dir_content
-                        })
-                        statuses.append(rabbitvcs_status)
-                        directories[path_to_check] = dir_content
-                    
-                    if path_to_check == "" or path_to_check == self.repository_path:
-                        break
-
-                    path_to_check = os.path.split(path_to_check)[0]
-
-            index += 1
+                }))
+
+                self._add_parent_directories(item, relative_path, directories)
+                if content == "unknown":
+                    self._add_parent_directories(item, relative_path,
+                        unknown_directories)
+                elif content != "ignored":
+                    self._add_parent_directories(item, relative_path,
+                        tracked_directories)
+                if content not in ("clean", "ignored"):
+                    self._add_parent_directories(item, relative_path,
+                        changed_directories)
+
+        if not file_statuses:
+            return [rabbitvcs.vcs.status.Status.status_unknown(path)]
+
+        # A directory holding no tracked files is unknown, or ignored if all
+        # it holds is ignored files
+        statuses = []
+        for directory in sorted(directories):
+            if directory in tracked_directories:
+                if directory in changed_directories:
+                    content = "modified"
+                else:
+                    content = "clean"
+            elif directory in unknown_directories:
+                content = "unknown"
+            else:
+                content = "ignored"
+
+            statuses.append(rabbitvcs.vcs.status.MercurialStatus({
+                "path": self.get_absolute_path(directory),
+                "content": content
+            }))
+        statuses += file_statuses
+
+        # The whole subtree has been looked at, so cache all of it
+        for st in statuses:
+            self.cache[st.path] = st
+        self.cache.mark_scanned(path, True)
+
+        if not recurse and os.path.isdir(path):
+            statuses = [st for st in statuses if st.path == path
+                        or os.path.dirname(st.path) == path]
 
         return statuses
+
+    def _get_tracked_files(self):
+        """
+        Returns a sorted list of the files in the dirstate that Mercurial
+        would list as clean if they have not changed (ie. everything but added
+        and removed files).
+        
+        The list is kept until .hg/dirstate changes (by which time
+        refresh_repository will have dropped the repository's own copy of the
+        dirstate).
+        
+        """
+
+        try:
+            st = os.stat(os.path.join(self.repository_path, ".hg", "dirstate"))
+            stamp = (st.st_mtime, st.st_size)
+        except OSError:
+            stamp = None
+
+        if (stamp is not None and self.dirstate_snapshot
+                and self.dirstate_snapshot[0] == stamp):
+            return self.dirstate_snapshot[1]
+
+        dirstate = self.repository.dirstate
+        tracked_files = [name for name in dirstate if dirstate[name] in "nm"]
+        tracked_files.sort()
+
+        self.dirstate_snapshot = (stamp, tracked_files)
+        return tracked_files
+
+    def _get_clean_files(self, tracked_files, top, mercurial_statuses):
+        """
+        Returns the tracked files at or below top (relative to the repository
+        root) that Mercurial has not listed with any other status.
+        
+        """
+
+        if top:
+            # Every path below top sorts between "top/" and "top0", as "0"
+            # comes straight after "/"
+            files = []
+            index = bisect_left(tracked_files, top)
+            if index < len(tracked_files) and tracked_files[index] == top:
+                files.append(top)
+            files += tracked_files[bisect_left(tracked_files, top + "/"):
+                bisect_left(tracked_files, top + "0")]
+        else:
+            files = tracked_files
+
+        listed = set()
+        for status_tuple in mercurial_statuses:
+            listed.update(status_tuple)
+
+        return [name for name in files if name not in listed]
+
+    def _add_parent_directories(self, name, top, directories):
+        """
+        Adds the directories between the given file and the directory top
+        (both relative to the repository root) to a set, stopping at the first
+        one that is already in it.
+        
+        """
+
+        if name == top:
+            return
+
+        directory = name
+        while directory != top:
+            directory = os.path.dirname(directory)
+            if directory in directories:
+                break
+            directories.add(directory)
     
     def status(self, path, summarize=True, invalidate=False):
-        all_statuses = self.statuses(path, invalidate=invalidate)
+        if path in self.cache:
+            if invalidate:
+                del self.cache[path]
+            else:
+                st = self.cache[path]
+                if summarize:
+                    st.summary = st.single
+                return st
+
+        all_statuses = self.statuses(path, recurse=False,
+                                     invalidate=invalidate)
 
         if summarize:
             path_status = None
@@ -271,3 +564,223 @@ class Mercurial:
     #
     # Actions
     #
+
+    def log(self, path=None, skip=0, limit=None, revision=Revision("HEAD"), showtype="all"):
+        """
+        Returns a revision history list
+        
+        @type   path    string
+        @param  path    If a path is specified, return changesets that contain
+                        changes to the specified path only
+        
+        @type   skip    int
+        @param  skip    The number of (newest) changesets to leave out
+        
+        @type   limit   int
+        @param  limit   If given, returns a limited number of changesets
+        
+        @type   revision mercurial.Revision
+        @param  revision With showtype "branch", the changeset to show the
+                         history of
+        
+        @type   showtype string
+        @param  showtype Determines which revisions to show.  "all" shows all
+                         revisions, "branch" shows just the ancestors of
+                         revision
+        
+        @returns    A list of rabbitvcs.vcs.log.Log objects
+        
+        """
+        
+        return list(self.log_iter(path, skip, limit, revision, showtype))
+
+    def log_iter(self, path=None, skip=0, limit=None, revision=Revision("HEAD"), showtype="all"):
+        """
+        Yields the changesets of a revision history as rabbitvcs.vcs.log.Log
+        objects, newest first.  Changesets are only looked at as they are
+        needed, so skipping and limiting are cheap.  See log for the
+        parameters.
+        
+        """
+        
+        self.refresh_repository()
+        repository = self.repository
+
+        if showtype == "all":
+            expression = "reverse(all())"
+            args = []
+        else:
+            ctx = self._get_changectx(revision)
+            if ctx.rev() is None:
+                ctx = ctx.p1()
+            expression = "reverse(::%n)"
+            args = [ctx.node()]
+
+        relative_path = ""
+        if path:
+            relative_path = self.get_relative_path(path)
+        if relative_path:
+            expression += " and file(%s)"
+            args.append("path:" + relative_path)
+
+        head = repository["."].node()
+
+        # Changesets are usually followed by their first parent, so share the
+        # revision objects between them
+        revisions = {}
+        def get_revision(hex):
+            if hex not in revisions:
+                revisions[hex] = self.revision(hex)
+            return revisions[hex]
+
+        stop = None
+        if limit:
+            stop = skip + limit
+
+        for rev in islice(repository.revs(expression, *args), skip, stop):
+            ctx = repository[rev]
+
+            author = ctx.user()
+            pos = author.find("<")
+            if pos > 0:
+                author = author[0:pos].strip()
+            if not author:
+                author = _("(no author)")
+
+            parents = [get_revision(parent.hex()) for parent in ctx.parents()
+                if parent.rev() != -1]
+
+            refs = ctx.bookmarks() + [tag for tag in ctx.tags() if tag != "tip"]
+
+            yield rabbitvcs.vcs.log.Log(
+                datetime.fromtimestamp(ctx.date()[0]),
+                revisions.pop(ctx.hex(), None) or self.revision(ctx.hex()),
+                author,
+                ctx.description(),
+                self._get_changed_paths(ctx.p1(), ctx),
+                parents,
+                ctx.node() == head,
+                refs
+            )
+
+    def _get_changed_paths(self, ctx1, ctx2, match=None):
+        """
+        Returns a list of LogChangedPath objects for the files that differ
+        between two changesets (or a changeset and the working directory).
+        
+        """
+        
+        status = ctx1.status(ctx2, match=match)
+
+        changed_paths = []
+        for action, files in (("M", status.modified), ("A", status.added),
+                ("D", status.removed)):
+            for name in files:
+                changed_paths.append(rabbitvcs.vcs.log.LogChangedPath(
+                    name, action, "", ""))
+
+        changed_paths.sort(key=lambda changed_path: changed_path.path)
+        return changed_paths
+
+    def annotate(self, path, revision_obj=Revision("HEAD")):
+        """
+        Returns an annotation for a specified file
+            
+        @type   path: string
+        @param  path: The absolute path to a tracked file
+        
+        @type   revision_obj: mercurial.Revision
+        @param  revision_obj: The revision to annotate the file at
+        
+        """
+        
+        self.refresh_repository()
+        ctx = self._get_changectx(revision_obj)
+        if ctx.rev() is None:
+            ctx = ctx.p1()
+
+        relative_path = self.get_relative_path(path)
+        if relative_path not in ctx:
+            return []
+
+        changesets = {}
+        returner = []
+        for number, line in enumerate(ctx[relative_path].annotate()):
+            line_ctx = line.fctx.changectx()
+            if line_ctx.rev() not in changesets:
+                author = line_ctx.user()
+                pos = author.find("<")
+                if pos > 0:
+                    author = author[0:pos].strip()
+
+                changesets[line_ctx.rev()] = (line_ctx.hex(), author,
+                    datetime.fromtimestamp(line_ctx.date()[0]))
+
+            (hex, author, date) = changesets[line_ctx.rev()]
+            returner.append({
+                "revision": hex,
+                "author": author,
+                "date": date,
+                "line": line.text.rstrip("\n"),
+                "number": str(number + 1)
+            })
+
+        return returner
+
+    def diff(self, path1, revision_obj1, path2=None, revision_obj2=None):
+        """
+        Returns the diff between the path(s)/revision(s)
+        
+        @type   path1: string
+        @param  path1: The absolute path to a file
+
+        @type   revision_obj1: mercurial.Revision()
+        @param  revision_obj1: The revision object for path1
+
+        @type   path2: string
+        @param  path2: The absolute path to a file
+
+        @type   revision_obj2: mercurial.Revision()
+        @param  revision_obj2: The revision object for path2, or None for the
+            working directory
+               
+        """
+        
+        self.refresh_repository()
+        ctx1 = self._get_changectx(revision_obj1)
+        if ctx1.rev() is None:
+            ctx1 = ctx1.p1()
+        ctx2 = self._get_changectx(revision_obj2)
+
+        match = self._get_match(ctx2, [path for path in (path1, path2) if path])
+        chunks = patch.diff(self.repository, ctx1.node(), ctx2.node(), match)
+
+        return "".join(chunks)
+
+    def diff_summarize(self, path1, revision_obj1, path2=None, revision_obj2=None):
+        """
+        Returns a diff summary between the path(s)/revision(s)
+        
+        @type   path1: string
+        @param  path1: The absolute path to a file
+
+        @type   revision_obj1: mercurial.Revision()
+        @param  revision_obj1: The revision object for path1
+
+        @type   path2: string
+        @param  path2: The absolute path to a file
+
+        @type   revision_obj2: mercurial.Revision()
+        @param  revision_obj2: The revision object for path2, or None for the
+            working directory
+               
+        """
+        
+        self.refresh_repository()
+        ctx1 = self._get_changectx(revision_obj1)
+        if ctx1.rev() is None:
+            ctx1 = ctx1.p1()
+        ctx2 = self._get_changectx(revision_obj2)
+
+        match = self._get_match(ctx2, [path for path in (path1, path2) if path])
+        return self._get_changed_paths(ctx1, ctx2, match)
@@ -22,7 +22,9 @@
 
 import os.path
 import unittest
+import weakref
 
+from collections import OrderedDict, deque
 from datetime import datetime
 
 import rabbitvcs.vcs
@@ -60,7 +62,302 @@ MODIFIED_CHILD_STATUSES = [
     status_replaced
 ]
 
+class PathIndex(object):
+    """
+    Indexes paths by their components, so that every path below a directory
+    can be found (or removed) without looking at any of the other paths.
+    
+    Each node is a dict of child component names to child nodes. If the path
+    leading to a node has been added, the node also maps None to that path.
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def _components(self, path):
+        return [part for part in path.split(os.sep) if part]
+
+    def _find_node(self, path):
+        node = self.root
+        for part in self._components(path):
+            node = node.get(part)
+            if node is None:
+                break
+        return node
+
+    def add(self, path):
+        node = self.root
+        for part in self._components(path):
+            node = node.setdefault(part, {})
+        node[None] = path
+
+    def remove(self, path):
+        parts = self._components(path)
+        nodes = [self.root]
+        for part in parts:
+            node = nodes[-1].get(part)
+            if node is None:
+                return
+            nodes.append(node)
+
+        nodes[-1].pop(None, None)
+
+        # Prune the nodes that no longer lead anywhere
+        for index in xrange(len(parts), 0, -1):
+            if nodes[index]:
+                break
+            del nodes[index - 1][parts[index - 1]]
+
+    def remove_subtree(self, path):
+        """
+        Removes the given path and everything below it, returning the paths
+        that were removed.
+        """
+        parts = self._components(path)
+        if not parts:
+            removed = list(self.iter_subtree(path))
+            self.root = {}
+            return removed
+
+        nodes = [self.root]
+        for part in parts:
+            node = nodes[-1].get(part)
+            if node is None:
+                return []
+            nodes.append(node)
+
+        removed = list(self._iter_node(nodes[-1]))
+
+        # Prune the nodes that no longer lead anywhere
+        for index in xrange(len(parts), 0, -1):
+            del nodes[index - 1][parts[index - 1]]
+            if nodes[index - 1]:
+                break
+        return removed
+
+    def has_subtree(self, path):
+        """
+        Whether the given path or any path below it has been added.
+        """
+        return bool(self._find_node(path))
+
+    def iter_subtree(self, path):
+        """
+        Yields the given path (if it has been added) and every added path
+        below it. The given path is always the first path to be yielded.
+        """
+        node = self._find_node(path)
+        if node is not None:
+            for subpath in self._iter_node(node):
+                yield subpath
+
+    def iter_children(self, path):
+        """
+        Yields the added paths immediately below the given path.
+        """
+        node = self._find_node(path)
+        if node is not None:
+            for key, child in node.iteritems():
+                if key is not None and None in child:
+                    yield child[None]
+
+    def _iter_node(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, value in node.iteritems():
+                if key is None:
+                    yield value
+                else:
+                    stack.append(value)
+
+class PathMap(object):
+    """
+    Maps paths to values, indexing the paths (see PathIndex) so that the
+    entries at or below a directory can be found or removed without looking
+    at any of the others.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.index = PathIndex()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, path):
+        return path in self.values
+
+    def __getitem__(self, path):
+        return self.values[path]
+
+    def __setitem__(self, path, value):
+        if path not in self.values:
+            self.index.add(path)
+        self.values[path] = value
+
+    def get(self, path, default=None):
+        return self.values.get(path, default)
+
+    def pop(self, path, default=None):
+        if path not in self.values:
+            return default
+        self.index.remove(path)
+        return self.values.pop(path)
+
+    def keys(self):
+        return self.values.keys()
+
+    def has_subtree(self, path):
+        """
+        Whether there is an entry for the given path or for any path below it.
+        """
+        return self.index.has_subtree(path)
+
+    def pop_subtree(self, path):
+        """
+        Removes the entries for the given path and for everything below it.
+        """
+        for key in self.index.remove_subtree(path):
+            del self.values[key]
+
+class InternTable(object):
+    """
+    Maps values (eg. authors or revisions) to small integer ids so that each
+    distinct value is only stored once, however many statuses refer to it.
+    
+    Ids are reference counted. When a value is no longer referred to its slot
+    is freed and reused, and once most of the slots are free the table can be
+    compacted (see compact()).
+    """
+    
+    # Don't bother compacting tables with fewer free slots than this
+    compact_threshold = 256
+
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+        self.refcounts = []
+        self.free = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intern(self, value):
+        """
+        Returns the id for the given value, adding it if needed, and takes a
+        reference to it.
+        """
+        value_id = self.ids.get(value)
+        if value_id is None:
+            if self.free:
+                value_id = self.free.pop()
+                self.values[value_id] = value
+                self.refcounts[value_id] = 0
+            else:
+                value_id = len(self.values)
+                self.values.append(value)
+                self.refcounts.append(0)
+            self.ids[value] = value_id
+
+        self.refcounts[value_id] += 1
+        return value_id
+
+    def release(self, value_id):
+        """
+        Drops a reference to the given id, freeing it if it is not used any
+        more.
+        """
+        self.refcounts[value_id] -= 1
+        if self.refcounts[value_id] <= 0:
+            del self.ids[self.values[value_id]]
+            self.values[value_id] = None
+            self.refcounts[value_id] = 0
+            self.free.append(value_id)
+
+    def lookup(self, value_id):
+        return self.values[value_id]
+
+    def needs_compaction(self):
+        return (len(self.free) >= self.compact_threshold
+                    and len(self.free) * 2 > len(self.values))
+
+    def compact(self):
+        """
+        Removes the free slots from the table.
+        
+        @rtype:     list
+        @return:    A list mapping each old id to its new id (or None for ids
+                    that were free).
+        """
+        mapping = [None] * len(self.values)
+        values = []
+        refcounts = []
+        for value_id, refcount in enumerate(self.refcounts):
+            if refcount > 0:
+                mapping[value_id] = len(values)
+                values.append(self.values[value_id])
+                refcounts.append(refcount)
+
+        self.values = values
+        self.refcounts = refcounts
+        self.free = []
+        self.ids = dict([(value, value_id) for (value_id, value)
+                            in enumerate(values)])
+        return mapping
+
+_status_cache_limits = None
+
+def get_status_cache_limits():
+    """
+    Returns the (max_entries, max_bytes) limits for status caches from the
+    user's settings. A limit of 0 means there is no limit. The settings are
+    only read the first time.
+    """
+    global _status_cache_limits
+
+    if _status_cache_limits is None:
+        try:
+            import rabbitvcs.util.settings
+            sm = rabbitvcs.util.settings.SettingsManager()
+            _status_cache_limits = (int(sm.get("cache", "status_max_entries")),
+                                    int(sm.get("cache", "status_max_bytes")))
+        except Exception, e:
+            log.debug(e)
+            _status_cache_limits = (0, 0)
+
+    return _status_cache_limits
+
+# The shared status caches that hold any statuses (see make_status_cache)
+_shared_caches = weakref.WeakSet()
+
+def make_status_cache():
+    """
+    Returns a status cache for a VCS client. The limits from the user's
+    settings are shared between every such cache in the process, so that
+    having several clients (eg. one per checker worker) does not multiply
+    them.
+    """
+    (max_entries, max_bytes) = get_status_cache_limits()
+    return StatusCache(max_entries, max_bytes, shared=True)
+
 class StatusCache(object):
+    """
+    Caches statuses in a compact form. 
+    
+    Entries are grouped into subtrees (normally working copies, see
+    mark_subtree), and if the cache grows beyond its limits then the least
+    recently used subtrees are evicted as a whole. If that is not enough, the
+    oldest entries are trimmed one at a time.
+    """
+
+    # A rough estimate of the memory used by an entry, not counting its path
+    entry_overhead = 400
+
+    # How many more paths than entries the added queue can hold before it is
+    # pruned
+    added_slack = 64
+
     keys = [
         None,
         status_normal,
@@ -79,29 +376,68 @@ class StatusCache(object):
         status_error
     ]
     
-    authors = []
-    revisions = []
+    key_indexes = dict([(key, index) for (index, key) in enumerate(keys)])
 
-    def __init__(self):
+    def __init__(self, max_entries=0, max_bytes=0, shared=False):
+        """
+        @type   max_entries: int
+        @param  max_entries: The most entries to keep, or 0 for no limit
+
+        @type   max_bytes: int
+        @param  max_bytes: Roughly the most memory to use, or 0 for no limit
+        
+        @type   shared: boolean
+        @param  shared: Whether the limits are split evenly between every
+                        shared cache that holds any statuses
+        
+        """
         self.cache = {}
+        self.index = PathIndex()
+        self.authors = InternTable()
+        self.revisions = InternTable()
+
+        # Paths in the order they were added, for trimming. May also hold
+        # paths that have since been removed (see _prune_added).
+        self.added = deque()
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.size = 0
+
+        # Subtree roots, least recently used first
+        self.subtrees = OrderedDict()
+
+        # Paths whose statuses have been scanned, mapped to whether the
+        # scan was recursive (see mark_scanned)
+        self.scanned = PathMap()
+
+        # Cached paths with complicated or modified statuses at or below
+        # them (see summarize)
+        self.summaries = PathMap()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def __setitem__(self, path, status):
         try:
-            content_index = self.keys.index(status.simple_content_status())
-            metadata_index = self.keys.index(status.simple_metadata_status())
-
-            try:
-                author_index = self.authors.index(status.author)
-            except ValueError, e:
-                self.authors.append(status.author)
-                author_index = len(self.authors) -1
-
-            try:
-                revision_index = self.revisions.index(status.revision)
-            except ValueError, e:
-                self.revisions.append(status.revision)
-                revision_index = len(self.revisions) -1
+            content_index = self.key_indexes[status.simple_content_status()]
+            metadata_index = self.key_indexes[status.simple_metadata_status()]
+
+            author_index = self.authors.intern(status.author)
+            revision_index = self.revisions.intern(status.revision)
             
+            if path in self.cache:
+                self._release(self.cache[path])
+            else:
+                if self.shared and not self.cache:
+                    _shared_caches.add(self)
+                self.index.add(path)
+                self.added.append(path)
+                self.size += self.entry_overhead + len(path)
+                self._prune_added()
+
             self.cache[path] = (
                 content_index,
                 metadata_index,
@@ -111,6 +447,8 @@ class StatusCache(object):
             )
         except Exception, e:
             log.debug(e)
+
+        self._evict()
             
     def __getitem__(self, path):
         try:
@@ -118,8 +456,8 @@ class StatusCache(object):
             
             content = self.keys[content_index]
             metadata = self.keys[metadata_index]
-            revision = self.revisions[revision_index]
-            author = self.authors[author_index]
+            revision = self.revisions.lookup(revision_index)
+            author = self.authors.lookup(author_index)
             
             return Status(path, content, metadata, revision=revision, 
                 author=author, date=date)
@@ -127,26 +465,329 @@ class StatusCache(object):
             log.debug(e)
 
     def __delitem__(self, path):
+        self._unmark_scanned(path)
+        self.summaries.pop(path, None)
         try:
-            del self.cache[path]
+            self._release(self.cache.pop(path))
+            self.index.remove(path)
+            self.size -= self.entry_overhead + len(path)
+            self._prune_added()
+            self._compact()
         except KeyError, e:
             log.debug(e)
 
+    def _release(self, entry):
+        (content_index, metadata_index, revision_index, author_index, date) = entry
+        self.revisions.release(revision_index)
+        self.authors.release(author_index)
+
+    def _compact(self):
+        """
+        Compacts the author and revision tables once enough of their entries
+        have been freed, renumbering the cache entries to match.
+        """
+        author_map = None
+        revision_map = None
+        if self.authors.needs_compaction():
+            author_map = self.authors.compact()
+        if self.revisions.needs_compaction():
+            revision_map = self.revisions.compact()
+
+        if author_map is None and revision_map is None:
+            return
+
+        for path, entry in self.cache.iteritems():
+            (content_index, metadata_index, revision_index, author_index, date) = entry
+            if revision_map is not None:
+                revision_index = revision_map[revision_index]
+            if author_map is not None:
+                author_index = author_map[author_index]
+            self.cache[path] = (content_index, metadata_index, revision_index,
+                                author_index, date)
+
             
     def __contains__(self, path):
-        return path in self.cache
+        if path in self.cache:
+            self.hits += 1
+            self._touch(path)
+            return True
+
+        self.misses += 1
+        return False
+
+    def __len__(self):
+        return len(self.cache)
+
+    def mark_scanned(self, path, recurse):
+        """
+        Records that the statuses of the given path and of its immediate
+        children (and, if recurse is True, of everything below it) are in
+        the cache. The record is dropped when any of them is invalidated.
+        """
+        if recurse or not self.scanned.get(path):
+            self.scanned[path] = recurse
+
+    def is_scanned(self, path, recurse):
+        """
+        Whether the statuses of the given path and its immediate children (or,
+        if recurse is True, of everything below it) are in the cache.
+        """
+        if path in self.scanned and (self.scanned[path] or not recurse):
+            return True
+
+        parent = os.path.dirname(path)
+        while parent != path:
+            if self.scanned.get(parent):
+                return True
+            (path, parent) = (parent, os.path.dirname(parent))
+
+        return False
+
+    def has_scans(self, root):
+        """
+        Whether the given path or anything below it has been scanned.
+        """
+        return self.scanned.has_subtree(root)
+
+    def _unmark_scanned(self, path):
+        """
+        Forgets the scans that covered the given path.
+        """
+        self.scanned.pop(path, None)
+        parent = os.path.dirname(path)
+        while parent != path:
+            self.scanned.pop(parent, None)
+            (path, parent) = (parent, os.path.dirname(parent))
+
+    def forget_scans(self, root):
+        """
+        Forgets the scans of the given path and of everything below it, but
+        keeps their statuses, so that they are still there to be looked at
+        until the path has been scanned again.
+        """
+        self.scanned.pop_subtree(root)
+
+    def mark_subtree(self, root):
+        """
+        Registers the given path (normally the root of a working copy) as a
+        subtree that is evicted as a whole, and marks it as the most recently
+        used one.
+        """
+        self.subtrees.pop(root, None)
+        self.subtrees[root] = True
+
+    def _find_subtree(self, path):
+        while path not in self.subtrees:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+        return path
+
+    def _touch(self, path):
+        root = self._find_subtree(path)
+        if root is not None:
+            self.mark_subtree(root)
+
+    def _share(self, limit):
+        if not limit or not self.shared:
+            return limit
+        return max(1, limit // max(1, len(_shared_caches)))
+
+    def _over_limits(self):
+        max_entries = self._share(self.max_entries)
+        max_bytes = self._share(self.max_bytes)
+        return ((max_entries and len(self.cache) > max_entries)
+                    or (max_bytes and self.size > max_bytes))
+
+    def _evict(self):
+        """
+        Evicts the least recently used subtrees until the cache is within its
+        limits. The most recently used subtree is not evicted as a whole,
+        since it is most likely the one being filled; if it is too big on its
+        own then its oldest entries are trimmed instead.
+        """
+        while self._over_limits() and len(self.subtrees) > 1:
+            root = self.subtrees.popitem(last=False)[0]
+            count = len(self.cache)
+            self.invalidate_path(root)
+            self.evictions += count - len(self.cache)
+
+        if self._over_limits():
+            self._trim()
+
+    def _trim(self):
+        """
+        Removes the oldest entries until the cache is within its limits.
+        """
+        while self._over_limits() and self.added:
+            path = self.added.popleft()
+            if path in self.cache:
+                self._unmark_scanned(path)
+                self.summaries.pop(path, None)
+                self._release(self.cache.pop(path))
+                self.index.remove(path)
+                self.size -= self.entry_overhead + len(path)
+                self.evictions += 1
+
+        self._prune_added()
+        self._compact()
+
+    def _prune_added(self):
+        """
+        Drops the paths that have been removed from the cache since they were
+        queued (and all but the latest of the paths queued more than once),
+        once they make up more than half of the added queue.
+        """
+        if len(self.added) <= 2 * len(self.cache) + self.added_slack:
+            return
+
+        seen = set()
+        paths = []
+        for path in reversed(self.added):
+            if path in self.cache and path not in seen:
+                seen.add(path)
+                paths.append(path)
+        paths.reverse()
+        self.added = deque(paths)
+
+    def statistics(self):
+        return {
+            "entries": len(self.cache),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
 
     def find_path_statuses(self, path):
-        statuses = []
-        if os.path.isdir(path):
-            for key, value in self.cache.items():
-                if key.startswith(path):
-                    statuses.append(self.__getitem__(key))
-        else:
+        """
+        Returns the cached statuses for the given path and for everything
+        below it. The status of the path itself comes first.
+        """
+        statuses = [self.__getitem__(key)
+                        for key in self.index.iter_subtree(path)]
+
+        if not statuses:
             statuses.append(self.__getitem__(path))
             
         return statuses
 
+    def invalidate_ancestors(self, path):
+        """
+        Removes the directories above the given path from the cache (but not
+        the rest of their contents), since their summaries depend on it.
+        """
+        parent = os.path.dirname(path)
+        while parent != path:
+            if parent in self.cache:
+                self.__delitem__(parent)
+            (path, parent) = (parent, os.path.dirname(parent))
+
+    def invalidate_path(self, path, keep_ancestor_scans=False):
+        """
+        Removes the given path and everything below it from the cache.
+        
+        @type   keep_ancestor_scans: boolean
+        @param  keep_ancestor_scans: Whether to keep the scans of the
+                                     directories above the path, eg. because
+                                     the path is about to be scanned again
+        
+        """
+        if keep_ancestor_scans:
+            self.forget_scans(path)
+        else:
+            self._unmark_scanned(path)
+            self.forget_scans(path)
+
+        for key in self.index.remove_subtree(path):
+            self._release(self.cache.pop(key))
+            self.summaries.pop(key, None)
+            self.size -= self.entry_overhead + len(key)
+        self._prune_added()
+        self._compact()
+
+    def _own_summary(self, status):
+        if status.single == status_complicated:
+            return status_complicated
+        elif status.single in MODIFIED_CHILD_STATUSES:
+            return status_modified
+        return None
+
+    def summarize(self, root, statuses):
+        """
+        Works out, in a single pass over the statuses from a recursive scan
+        of root, which paths have complicated or modified statuses at or
+        below them, so that their summaries can be given straight from the
+        cache (see get_summary).
+        """
+        self.summaries.pop_subtree(root)
+
+        for st in statuses:
+            summary = self._own_summary(st)
+            if summary is None:
+                continue
+
+            # Stop at the first path that already has a summary at least as
+            # strong, since everything above it has too
+            path = st.path
+            while True:
+                current = self.summaries.get(path)
+                if current == summary or current == status_complicated:
+                    break
+                if path in self.cache:
+                    self.summaries[path] = summary
+
+                if path == root:
+                    break
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+
+    def resummarize(self, path, parents=True):
+        """
+        Works out the summary of the given path (and, if parents is True, of
+        the directories above it) again from its immediate children, eg.
+        after the path has been scanned on its own.
+        """
+        while path in self.cache:
+            summary = self._own_summary(self.__getitem__(path))
+            if summary != status_complicated:
+                for child in self.index.iter_children(path):
+                    child_summary = self.summaries.get(child)
+                    if child_summary == status_complicated:
+                        summary = child_summary
+                        break
+                    elif child_summary is not None:
+                        summary = child_summary
+
+            if summary is None:
+                self.summaries.pop(path, None)
+            else:
+                self.summaries[path] = summary
+
+            parent = os.path.dirname(path)
+            if not parents or parent == path:
+                break
+            path = parent
+
+    def get_summary(self, status):
+        """
+        Returns the summary for a cached status, given that its path has been
+        recursively scanned.
+        """
+        summary = self.summaries.get(status.path)
+        if summary == status_complicated:
+            return summary
+        elif status.single in ["added", "modified", "deleted"]:
+            # These take priority over child statuses
+            return status.single
+        elif summary is not None:
+            return summary
+        else:
+            return status.single
+
 class Status(object):
 
     @staticmethod
@@ -486,5 +1127,171 @@ class TestStatusObjects(unittest.TestCase):
         top_status.make_summary(child_sts)
         self.assertEqual(top_status.summary, status_added)
 
+class TestStatusCache(unittest.TestCase):
+
+    base = "/path/to/test"
+
+    def setUp(self):
+        self.cache = StatusCache(0, 0)
+        for path in [self.base, self.base + "/a", self.base + "/a/b",
+                     self.base + "/c", self.base + "ing"]:
+            self.cache[path] = Status(path, status_normal)
+
+    def testfind_subtree(self):
+        paths = [st.path for st in self.cache.find_path_statuses(self.base)]
+        self.assertEqual(paths[0], self.base)
+        self.assertEqual(sorted(paths), [self.base, self.base + "/a",
+                                         self.base + "/a/b", self.base + "/c"])
+
+    def testfind_file(self):
+        statuses = self.cache.find_path_statuses(self.base + "/a/b")
+        self.assertEqual([st.path for st in statuses], [self.base + "/a/b"])
+
+    def testinvalidate_subtree(self):
+        self.cache.invalidate_path(self.base + "/a")
+        self.assertFalse(self.base + "/a" in self.cache)
+        self.assertFalse(self.base + "/a/b" in self.cache)
+        self.assertTrue(self.base in self.cache)
+        paths = [st.path for st in self.cache.find_path_statuses(self.base)]
+        self.assertEqual(sorted(paths), [self.base, self.base + "/c"])
+
+    def testdelete_keeps_children(self):
+        del self.cache[self.base + "/a"]
+        statuses = self.cache.find_path_statuses(self.base + "/a")
+        self.assertEqual([st.path for st in statuses], [self.base + "/a/b"])
+
+    def testinterned_per_cache(self):
+        other = StatusCache(0, 0)
+        other[self.base] = Status(self.base, status_normal, author="other")
+        self.assertEqual(len(self.cache.authors), 1)
+        self.assertEqual(len(other.authors), 1)
+        self.assertEqual(self.cache[self.base].author, None)
+        self.assertEqual(other[self.base].author, "other")
+
+    def testinterned_released(self):
+        path = self.base + "/a/b"
+        self.cache[path] = Status(path, status_modified, revision=2,
+                                  author="someone")
+        self.assertEqual(len(self.cache.revisions), 2)
+        self.cache.invalidate_path(self.base + "/a")
+        self.assertEqual(len(self.cache.revisions), 1)
+        self.assertEqual(len(self.cache.authors), 1)
+
+    def testinterned_compaction(self):
+        paths = [self.base + "/d/%i" % i for i in xrange(1000)]
+        for i, path in enumerate(paths):
+            self.cache[path] = Status(path, status_normal, revision=i)
+        self.cache.invalidate_path(self.base + "/d")
+        self.assertEqual(len(self.cache.revisions.values), 1)
+        path = self.base + "/c"
+        self.cache[path] = Status(path, status_normal, revision=7)
+        self.assertEqual(self.cache[path].revision, 7)
+        self.assertEqual(self.cache[self.base].revision, None)
+
+    def testevict_least_recent_subtree(self):
+        cache = StatusCache(max_entries=4, max_bytes=0)
+        for root in ["/wc1", "/wc2", "/wc3"]:
+            cache.mark_subtree(root)
+            for path in [root, root + "/a"]:
+                cache[path] = Status(path, status_normal)
+
+        self.assertFalse("/wc1" in cache)
+        self.assertTrue("/wc3/a" in cache)
+        self.assertTrue("/wc2/a" in cache)
+        self.assertEqual(cache.evictions, 2)
+
+        # wc2 was just used, so wc3 should go next
+        cache.mark_subtree("/wc4")
+        cache["/wc4"] = Status("/wc4", status_normal)
+        self.assertTrue("/wc2" in cache)
+        self.assertFalse("/wc3" in cache)
+
+    def testshared_limits(self):
+        first = StatusCache(max_entries=4, max_bytes=0, shared=True)
+        second = StatusCache(max_entries=4, max_bytes=0, shared=True)
+        for cache, root in [(first, "/wc1"), (second, "/wc2")]:
+            cache.mark_subtree(root)
+            for name in "abcd":
+                path = root + "/" + name
+                cache[path] = Status(path, status_normal)
+
+        # The first cache only had to share once the second one was used
+        self.assertEqual(len(first), 4)
+        self.assertEqual(len(second), 2)
+
+        del cache, second
+        path = "/wc1/e"
+        first[path] = Status(path, status_normal)
+        self.assertEqual(len(first), 4)
+
+    def testtrim_single_subtree(self):
+        cache = StatusCache(max_entries=3, max_bytes=0)
+        cache.mark_subtree("/wc")
+        paths = ["/wc", "/wc/a", "/wc/b", "/wc/c", "/wc/d"]
+        for path in paths:
+            cache[path] = Status(path, status_normal)
+
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.evictions, 2)
+        self.assertFalse("/wc" in cache)
+        self.assertTrue("/wc/d" in cache)
+
+    def testadded_bounded(self):
+        path = self.base + "/a/b"
+        for i in xrange(1000):
+            self.cache[path] = Status(path, status_normal)
+            self.cache.invalidate_path(path)
+
+        self.assertTrue(len(self.cache.added) <=
+                        2 * len(self.cache) + self.cache.added_slack)
+
+    def testscanned(self):
+        self.cache.mark_scanned(self.base, False)
+        self.cache.mark_scanned(self.base + "/a", True)
+        self.assertTrue(self.cache.is_scanned(self.base, False))
+        self.assertFalse(self.cache.is_scanned(self.base, True))
+        self.assertTrue(self.cache.is_scanned(self.base + "/a/b", True))
+        self.assertFalse(self.cache.is_scanned(self.base + "/c", False))
+
+        # Invalidating something below a scan drops it
+        self.cache.invalidate_path(self.base + "/a/b")
+        self.assertFalse(self.cache.is_scanned(self.base + "/a", True))
+        self.assertFalse(self.cache.is_scanned(self.base, False))
+
+    def testinvalidate_keeps_ancestor_scans(self):
+        self.cache.mark_scanned(self.base, True)
+        self.cache.invalidate_path(self.base + "/a", keep_ancestor_scans=True)
+        self.assertTrue(self.cache.is_scanned(self.base, True))
+        self.assertTrue(self.cache.has_scans(self.base))
+
+    def testhas_scans(self):
+        self.cache.mark_scanned(self.base + "ing", True)
+        self.assertFalse(self.cache.has_scans(self.base))
+
+        self.cache.mark_scanned(self.base + "/a/b", False)
+        self.assertTrue(self.cache.has_scans(self.base))
+        self.cache.forget_scans(self.base + "/a")
+        self.assertFalse(self.cache.has_scans(self.base))
+        self.assertTrue(self.cache.has_scans(self.base + "ing"))
+
+    def testsummaries(self):
+        path = self.base + "/a/b"
+        self.cache[path] = Status(path, status_modified)
+        self.cache.summarize(self.base, self.cache.find_path_statuses(self.base))
+        self.assertEqual(self.cache.get_summary(self.cache[self.base]),
+                         status_modified)
+
+        self.cache[path] = Status(path, status_normal)
+        self.cache.resummarize(path)
+        self.assertEqual(self.cache.get_summary(self.cache[self.base]),
+                         status_normal)
+
+        # Summaries go with their entries
+        self.cache[path] = Status(path, status_complicated)
+        self.cache.resummarize(path)
+        self.assertEqual(len(self.cache.summaries), 3)
+        self.cache.invalidate_path(self.base + "/a")
+        self.assertEqual(self.cache.summaries.keys(), [self.base])
+
 if __name__ == "__main__":
     unittest.main()
@@ -235,50 +235,101 @@ class SVN:
         self.client = pysvn.Client()
         self.interface = "pysvn"
         self.vcs = rabbitvcs.vcs.VCS_SVN
-        self.cache = rabbitvcs.vcs.status.StatusCache()
+        self.cache = rabbitvcs.vcs.status.make_status_cache()
 
     def statuses(self, path, recurse=True, update=False, invalidate=False):
         """
 
         Look up the status for path.
 
+        The first recursive request in a working copy is answered from a
+        single recursive scan of the whole working copy, so that looking at
+        the subdirectories of a working copy one after the other does not
+        mean scanning each of them again. Other requests only look at the
+        path (and, if not recursive, its immediate children, whose statuses
+        are then not summaries).
+
         """
         
         if path in self.cache:
             if invalidate:
-                del self.cache[path]
-            else:
+                # Only the path needs scanning again, the rest of the working
+                # copy can still be answered from the cache
+                self.cache.invalidate_path(path, keep_ancestor_scans=True)
+            elif not update and self.cache.is_scanned(path, recurse):
                 return self.cache.find_path_statuses(path)
 
         on_error = rabbitvcs.vcs.status.Status.status_unknown(path)
 
-        if not self.is_in_a_or_a_working_copy(path):
+        def failed():
+            # The scans above the path no longer cover everything below them
+            if invalidate:
+                self.cache.invalidate_path(path)
             return [on_error]
 
-        depth = pysvn.depth.infinity if recurse else pysvn.depth.empty
+        if not self.is_in_a_or_a_working_copy(path):
+            return failed()
+
+        root = self.find_repository_path(path) or path
+        self.cache.mark_subtree(root)
+
+        if update:
+            scan_path = path
+            depth = pysvn.depth.infinity if recurse else pysvn.depth.empty
+        elif recurse and not self.cache.has_scans(root):
+            scan_path = root
+            depth = pysvn.depth.infinity
+        elif recurse:
+            scan_path = path
+            depth = pysvn.depth.infinity
+        else:
+            scan_path = path
+            depth = pysvn.depth.immediates
 
         try:
-            pysvn_statuses = self.client.status(path,
+            pysvn_statuses = self.client.status(scan_path,
                                                 depth=depth,
                                                 update=update)
-            if not len(pysvn_statuses):
-                # This is NOT in the PySVN documentation, but sometimes it
-                # returns an empty list if the file goes missing...
-                return [on_error]
-            else:
-                statuslist = []
-                for st in pysvn_statuses:
-                    rabbitvcs_status = rabbitvcs.vcs.status.SVNStatus(st)
-                    self.cache[st.path] = rabbitvcs_status
-                    statuslist.append(rabbitvcs_status)
-                    
-                return statuslist
         except pysvn.ClientError, ex:
             # TODO: uncommenting these might not be a good idea
             #~ traceback.print_exc()
             log.debug("Exception occured in SVN.status() for %s" % path)
             log.exception(ex)
-            return [on_error]
+            return failed()
+
+        if not len(pysvn_statuses):
+            # This is NOT in the PySVN documentation, but sometimes it
+            # returns an empty list if the file goes missing...
+            return failed()
+
+        if depth == pysvn.depth.infinity and not update:
+            # Drop anything that has gone away since the last scan
+            self.cache.invalidate_path(scan_path, keep_ancestor_scans=True)
+
+        statuslist = []
+        for st in pysvn_statuses:
+            rabbitvcs_status = rabbitvcs.vcs.status.SVNStatus(st)
+            self.cache[st.path] = rabbitvcs_status
+            statuslist.append(rabbitvcs_status)
+
+        if not update:
+            self.cache.mark_scanned(scan_path, recurse)
+            if recurse:
+                self.cache.summarize(scan_path, statuslist)
+            else:
+                for st in statuslist:
+                    if st.path != scan_path:
+                        self.cache.resummarize(st.path, parents=False)
+            self.cache.resummarize(scan_path)
+
+        if scan_path != path:
+            prefix = path.rstrip("/") + "/"
+            statuslist = [st for st in statuslist
+                            if st.path == path or st.path.startswith(prefix)]
+            if not statuslist:
+                return [on_error]
+
+        return statuslist
 
     def client_info(self, path):
         if islink(path):
@@ -296,27 +347,25 @@ class SVN:
         return None
 
     def status(self, path, summarize=True, invalidate=False):
-        if path in self.cache:
-            if invalidate:
-                del self.cache[path]
-            else:
+        if path in self.cache and not invalidate:
+            if not summarize:
+                return self.cache[path]
+            elif self.cache.is_scanned(path, True):
                 st = self.cache[path]
-                if summarize:
-                    st.summary = st.single
+                st.summary = self.cache.get_summary(st)
                 return st
 
-        all_statuses = self.statuses(path, recurse=summarize)
+        all_statuses = self.statuses(path, recurse=summarize,
+                                     invalidate=invalidate)
 
-        if summarize:
-            path_status = None
-            for st in all_statuses:
-                if st.path == path:
-                    path_status = st
-                    break
-            
-            path_status.make_summary(all_statuses)
-        else:
-            path_status = all_statuses[0]
+        path_status = all_statuses[0]
+        for st in all_statuses:
+            if st.path == path:
+                path_status = st
+                break
+
+        if summarize and self.cache.is_scanned(path, True):
+            path_status.summary = self.cache.get_summary(path_status)
 
         return path_status
 